@@ -1,11 +1,42 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 from datetime import datetime
+from typing import Optional
+
+# Background listener that drains the log queue into the file handler
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _stop_listener() -> None:
+    """Stop the queue listener, writing any queued records to disk."""
+    global _listener
+    
+    if _listener is None:
+        return
+    
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.flush()
+    _listener = None
 
 
 def setup_logging(log_level: str = "INFO", log_dir: str = "data/logs") -> None:
-    """Configure application logging with file and console handlers."""
+    """
+    Configure application logging with file and console handlers.
+    
+    Streamlit calls this on every rerun; handlers and the queue listener are
+    set up once per process, and later calls only apply the log level.
+    """
+    
+    global _listener
+    
+    root_logger = logging.getLogger()
+    root_logger.setLevel(getattr(logging, log_level.upper()))
+    if _listener is not None:
+        return
     
     # Ensure log directory exists
     os.makedirs(log_dir, exist_ok=True)
@@ -16,11 +47,7 @@ def setup_logging(log_level: str = "INFO", log_dir: str = "data/logs") -> None:
     )
     simple_formatter = logging.Formatter("%(levelname)s: %(message)s")
     
-    # Configure root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(getattr(logging, log_level.upper()))
-    
-    # Clear existing handlers
+    # Replace any handlers installed before this point
     root_logger.handlers.clear()
     
     # Console handler
@@ -36,9 +63,20 @@ def setup_logging(log_level: str = "INFO", log_dir: str = "data/logs") -> None:
     )
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(detailed_formatter)
-    root_logger.addHandler(file_handler)
+    
+    # Application threads only enqueue records; a single background thread
+    # performs the file I/O
+    log_queue = queue.Queue(-1)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, respect_handler_level=True
+    )
+    _listener.start()
     
     # Suppress noisy third-party loggers
     logging.getLogger("urllib3").setLevel(logging.WARNING)
     logging.getLogger("requests").setLevel(logging.WARNING)
-    logging.getLogger("openai").setLevel(logging.WARNING)
\ No newline at end of file
+    logging.getLogger("openai").setLevel(logging.WARNING)
+
+
+atexit.register(_stop_listener)
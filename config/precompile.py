@@ -0,0 +1,35 @@
+"""
+Write a settings snapshot so the app can start without parsing .env.
+
+Usage:
+    python -m config.precompile
+    export RAG_CONFIG_CACHED=1
+"""
+import os
+
+from config.settings import CONFIG_CACHE_PATH, Settings
+
+
+def precompile(env_file: str = ".env") -> str:
+    """
+    Resolve settings from the environment and .env once and save them.
+    
+    Args:
+        env_file: Path of the dotenv file to read
+    
+    Returns:
+        Path of the written settings snapshot
+    """
+    settings = Settings(_env_file=env_file)
+    
+    os.makedirs(os.path.dirname(CONFIG_CACHE_PATH), exist_ok=True)
+    with open(CONFIG_CACHE_PATH, "w", encoding="utf-8") as f:
+        f.write(settings.model_dump_json(indent=2))
+    
+    return CONFIG_CACHE_PATH
+
+
+if __name__ == "__main__":
+    path = precompile()
+    print(f"Wrote settings snapshot to {path}")
+    print("Set RAG_CONFIG_CACHED=1 to start the app from it without reading .env")
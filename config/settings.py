@@ -1,26 +1,83 @@
 import os
+from functools import lru_cache
 from typing import Optional
-from pydantic_settings import BaseSettings
+from pydantic import model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+# Settings snapshot written by `python -m config.precompile`
+CONFIG_CACHE_PATH = "data/config_cache.json"
+
+
+def config_cached() -> bool:
+    """
+    Whether the precompiled settings snapshot should replace .env parsing.
+    
+    RAG_CONFIG_CACHED only takes effect once the snapshot has been written;
+    without it, settings fall back to .env rather than silently losing it.
+    """
+    return bool(os.environ.get("RAG_CONFIG_CACHED")) and os.path.exists(CONFIG_CACHE_PATH)
 
 
 class Settings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=None if config_cached() else ".env",
+        case_sensitive=False
+    )
+    
     openai_api_key: Optional[str] = None
     chunk_size: int = 1000
     chunk_overlap: int = 200
     retrieval_count: int = 5
+    rerank_model: Optional[str] = None  # cross-encoder such as BAAI/bge-reranker-base; needs sentence-transformers
+    rerank_candidates: int = 50  # chunks retrieved for the reranker to pick retrieval_count from
+    query_embedding_cache_size: int = 4096  # recent query embeddings kept in memory
+    response_cache_size: int = 0  # answers kept for near-duplicate questions, shared by all sessions; 0 disables
+    response_cache_threshold: float = 0.98  # cosine similarity for reusing an answer; lower reuses answers to different questions
     temperature: float = 0.7
     max_tokens: int = 1000
     embedding_model: str = "text-embedding-ada-002"
+    embedding_batch_size: int = 100  # texts per embeddings request
+    embedding_cache_enabled: bool = True  # persist embeddings by content hash and reuse them
+    embedding_cache_memory_size: int = 10000  # cached embeddings also kept in memory
+    embeddings_prenormalized: bool = True  # embedding model returns unit vectors (true for OpenAI), so queries are not re-normalized
     chat_model: str = "gpt-3.5-turbo"
+    openai_requests_per_minute: int = 500  # client-side request rate limit; match your usage tier
+    openai_retry_attempts: int = 5  # attempts per OpenAI request before giving up
+    openai_retry_budget: float = 60.0  # seconds an OpenAI request may spend retrying before giving up
+    max_concurrent_requests: int = 35  # concurrent OpenAI requests; raise for higher rate-limit tiers
     max_file_size: int = 52428800  # 50MB in bytes
     vector_db_path: str = "data/vector_db"
     uploads_path: str = "data/uploads"
     logs_path: str = "data/logs"
+    processing_workers: int = 0  # PDF worker processes, 0 = one per CPU core
+    upload_backend: str = "mmap"  # how workers read spooled uploads: mmap (page cache, no read buffers) or file
+    page_range_threshold: int = 100  # pages from which a single upload is extracted in page ranges across worker processes, 0 = never
+    index_storage: str = "float32"  # vector storage for exhaustive search: float32, fp16 or int8
+    ivf_threshold: int = 50000  # switch the vector index to IVF-PQ past this many vectors
+    ivf_nlist: int = 1024  # IVF cells
+    pq_subquantizers: int = 32  # PQ bytes per vector; must divide the embedding dimension
+    nprobe: int = 16  # IVF cells probed per search
+    max_index_shards: int = 16  # saves appended as shards before the index files are rewritten
+    mmap_index: bool = True  # map the saved vector index read-only instead of reading it into memory
+    index_save_interval: int = 10  # files added between index saves during an upload, 0 = save only at the end
+    use_gpu: bool = True  # search on GPU when FAISS has GPU support and a device is present
+    search_batch_window_ms: float = 0.0  # coalesce concurrent searches within this window, 0 = off
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
+    @model_validator(mode="after")
+    def _check_chunk_overlap(self) -> "Settings":
+        # Each chunk must start past the previous one; fail at startup rather
+        # than on every upload
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError(
+                f"CHUNK_OVERLAP ({self.chunk_overlap}) must be smaller than CHUNK_SIZE ({self.chunk_size})"
+            )
+        return self
 
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    return Settings()
\ No newline at end of file
+    """Return the process-wide settings, parsed from the environment once."""
+    if config_cached():
+        with open(CONFIG_CACHE_PATH, "r", encoding="utf-8") as f:
+            return Settings.model_validate_json(f.read())
+    return Settings()
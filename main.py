@@ -1,64 +1,112 @@
+from __future__ import annotations
+
 import streamlit as st
 import logging
 import os
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+from config.settings import config_cached, get_settings
+
+# Load environment variables, unless a precompiled settings snapshot is in use
+if not config_cached():
+    load_dotenv()
 
 # Setup logging
 from config.logging import setup_logging
-from config.settings import get_settings
 
-# Import services
+# Import services; those built on the OpenAI SDK are imported by their
+# factories below, so a session without an API key never loads it
 from src.services.document_service import DocumentService
-from src.services.embedding_service import EmbeddingService
 from src.services.vector_service import VectorService
-from src.services.rag_service import RAGService
-from src.services.chat_service import ChatService
 
-# Import UI components
+if TYPE_CHECKING:
+    from src.services.embedding_service import EmbeddingService
+    from src.services.rag_service import RAGService
+
+# Import UI components (pages are imported on first visit, see main())
 from src.ui.components.sidebar import render_sidebar, render_footer
-from src.ui.pages.chat import render_chat_page
-from src.ui.pages.documents import render_documents_page
-from src.ui.pages.settings import render_settings_page
 
+# Custom CSS injected on every run
+_CUSTOM_CSS = """
+<style>
+.main > div {
+    padding-top: 2rem;
+}
+.stAlert > div {
+    padding: 1rem;
+}
+.chat-message {
+    padding: 1rem;
+    border-radius: 0.5rem;
+    margin: 0.5rem 0;
+}
+.user-message {
+    background-color: #e3f2fd;
+}
+.assistant-message {
+    background-color: #f3e5f5;
+}
+</style>
+"""
+
+
+@st.cache_resource
+def get_document_service() -> DocumentService:
+    """Process-wide document service shared by all sessions."""
+    return DocumentService()
+
+
+@st.cache_resource
+def get_vector_service() -> VectorService:
+    """Process-wide vector service backed by the on-disk FAISS index."""
+    return VectorService()
 
-def initialize_services():
-    """Initialize all services and store in session state."""
+
+@st.cache_resource
+def get_embedding_service(api_key: str) -> EmbeddingService:
+    """Process-wide embedding service, keyed by API key."""
+    from src.services.embedding_service import EmbeddingService
+    return EmbeddingService(api_key)
+
+
+@st.cache_resource
+def get_rag_service(api_key: str) -> RAGService:
+    """Process-wide RAG service, keyed by API key."""
+    from src.services.rag_service import RAGService
+    return RAGService(api_key=api_key, vector_service=get_vector_service())
+
+
+def initialize_services() -> dict:
+    """Resolve the shared services and the per-session chat service."""
     
     settings = get_settings()
     
-    # Initialize services
-    if 'document_service' not in st.session_state:
-        st.session_state.document_service = DocumentService()
-    
-    if 'vector_service' not in st.session_state:
-        st.session_state.vector_service = VectorService()
-    
-    if 'embedding_service' not in st.session_state:
-        if not settings.openai_api_key:
-            st.error("❌ OpenAI API key not found. Please set OPENAI_API_KEY in your .env file.")
-            st.info("The app will run in limited mode. You can browse documents but cannot process new ones or chat.")
-            # Create a dummy service that will fail gracefully
-            st.session_state.embedding_service = None
-        else:
-            st.session_state.embedding_service = EmbeddingService(settings.openai_api_key)
+    services = {
+        "document_service": get_document_service(),
+        "vector_service": get_vector_service(),
+        "embedding_service": None,
+        "rag_service": None,
+    }
     
-    if 'rag_service' not in st.session_state:
-        if settings.openai_api_key:
-            st.session_state.rag_service = RAGService(
-                api_key=settings.openai_api_key,
-                vector_service=st.session_state.vector_service
-            )
-        else:
-            st.session_state.rag_service = None
+    if not settings.openai_api_key:
+        st.error("❌ OpenAI API key not found. Please set OPENAI_API_KEY in your .env file.")
+        st.info("The app will run in limited mode. You can browse documents but cannot process new ones or chat.")
+    else:
+        services["embedding_service"] = get_embedding_service(settings.openai_api_key)
+        services["rag_service"] = get_rag_service(settings.openai_api_key)
     
+    # Conversations are private to each browser session, so the chat service
+    # stays in session state rather than the shared resource cache
     if 'chat_service' not in st.session_state:
-        if st.session_state.rag_service:
-            st.session_state.chat_service = ChatService(st.session_state.rag_service)
+        if services["rag_service"]:
+            from src.services.chat_service import ChatService
+            st.session_state.chat_service = ChatService(services["rag_service"])
         else:
             st.session_state.chat_service = None
+    services["chat_service"] = st.session_state.chat_service
+    
+    return services
 
 
 def main():
@@ -76,50 +124,38 @@ def main():
         initial_sidebar_state="expanded"
     )
     
-    # Custom CSS for better styling
-    st.markdown("""
-    <style>
-    .main > div {
-        padding-top: 2rem;
-    }
-    .stAlert > div {
-        padding: 1rem;
-    }
-    .chat-message {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 0.5rem 0;
-    }
-    .user-message {
-        background-color: #e3f2fd;
-    }
-    .assistant-message {
-        background-color: #f3e5f5;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    # Custom CSS for better styling. Streamlit drops any element a rerun
+    # does not emit again, so the style block is rendered on every run.
+    st.markdown(_CUSTOM_CSS, unsafe_allow_html=True)
     
     try:
         # Initialize services
-        initialize_services()
+        services = initialize_services()
         
         # Render sidebar and get selected page
         page = render_sidebar(
-            st.session_state.document_service,
-            st.session_state.vector_service,
-            st.session_state.embedding_service
+            services["document_service"],
+            services["vector_service"],
+            services["embedding_service"]
         )
         
-        # Render selected page
+        # Render selected page, importing it only when first needed
         if page == "Chat":
-            render_chat_page(st.session_state.chat_service)
+            from src.ui.pages.chat import render_chat_page
+            render_chat_page(
+                services["chat_service"],
+                services["document_service"],
+                services["vector_service"]
+            )
         elif page == "Documents":
+            from src.ui.pages.documents import render_documents_page
             render_documents_page(
-                st.session_state.document_service,
-                st.session_state.embedding_service,
-                st.session_state.vector_service
+                services["document_service"],
+                services["embedding_service"],
+                services["vector_service"]
             )
         elif page == "Settings":
+            from src.ui.pages.settings import render_settings_page
             render_settings_page()
         
         # Render footer in sidebar
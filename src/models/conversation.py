@@ -1,23 +1,28 @@
+from collections import Counter, deque
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
-from pydantic import BaseModel, Field
+from typing import Any, ClassVar, Deque, List, Optional
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, computed_field, field_serializer, model_validator
+import time
 import uuid
 
 
-class ChatMessage(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+@dataclass(slots=True, kw_only=True)
+class ChatMessage:
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
     content: str
     role: str  # user, assistant, system
-    timestamp: datetime = Field(default_factory=datetime.now)
-    metadata: dict = {}
+    timestamp_ns: int = field(default_factory=time.time_ns)
+    metadata: dict = field(default_factory=dict)
 
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.timestamp_ns / 1e9)
 
 
 class SourceCitation(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     document_id: str
     document_name: str
     chunk_id: str
@@ -27,31 +32,76 @@ class SourceCitation(BaseModel):
 
 
 class ChatResponse(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     content: str
     sources: List[SourceCitation] = []
     response_time: float
-    timestamp: datetime = Field(default_factory=datetime.now)
+    timestamp_ns: int = Field(default_factory=time.time_ns)
     token_usage: Optional[dict] = None
 
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    @computed_field
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.timestamp_ns / 1e9)
+
+    @field_serializer("timestamp", when_used="json")
+    def serialize_timestamp(self, value: datetime) -> str:
+        return value.isoformat()
 
 
 class ConversationSession(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    # Older messages are dropped once a session holds this many
+    max_messages: ClassVar[int] = 200
+    # Size of the conversation-history window kept for prompt building
+    recent_window: ClassVar[int] = 10
+
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     messages: List[ChatMessage] = []
     created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
+    updated_ns: int = Field(default_factory=time.time_ns)
     metadata: dict = {}
 
+    # Messages added per role, including ones since trimmed from history
+    _role_counts: Counter = PrivateAttr(default_factory=Counter)
+    _recent: Deque[ChatMessage] = PrivateAttr(default=None)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _restore_updated_ns(cls, data: Any) -> Any:
+        # Sessions saved before updated_ns was stored carry only updated_at
+        if isinstance(data, dict) and "updated_ns" not in data and "updated_at" in data:
+            updated_at = data["updated_at"]
+            if isinstance(updated_at, str):
+                updated_at = datetime.fromisoformat(updated_at)
+            data = {**data, "updated_ns": int(updated_at.timestamp() * 1e9)}
+        return data
+
+    def model_post_init(self, __context: Any) -> None:
+        self._recent = deque(self.messages, maxlen=self.recent_window)
+        self._role_counts.update(message.role for message in self.messages)
+
+    @computed_field
+    @property
+    def updated_at(self) -> datetime:
+        return datetime.fromtimestamp(self.updated_ns / 1e9)
+
     def add_message(self, content: str, role: str) -> ChatMessage:
         message = ChatMessage(content=content, role=role)
         self.messages.append(message)
-        self.updated_at = datetime.now()
+        self._recent.append(message)
+        if len(self.messages) > self.max_messages:
+            del self.messages[:len(self.messages) - self.max_messages]
+        self._role_counts[role] += 1
+        self.updated_ns = time.time_ns()
         return message
 
     def get_recent_messages(self, count: int = 10) -> List[ChatMessage]:
-        return self.messages[-count:] if self.messages else []
\ No newline at end of file
+        if count <= 0:
+            return []
+        if count <= self.recent_window:
+            return list(self._recent)[-count:]
+        return self.messages[-count:]
+
+    def get_role_count(self, role: str) -> int:
+        """Number of messages with the given role added to this session."""
+        return self._role_counts[role]
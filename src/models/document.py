@@ -1,37 +1,41 @@
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_serializer
 import uuid
 
 
 class Document(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     filename: str
     file_size: int
     upload_timestamp: datetime = Field(default_factory=datetime.now)
     processing_status: str = "pending"  # pending, processing, completed, failed
     total_chunks: int = 0
     error_message: Optional[str] = None
+    file_hash: Optional[str] = None  # SHA-256 of the uploaded file
     metadata: dict = {}
 
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    @field_serializer("upload_timestamp", when_used="json")
+    def serialize_upload_timestamp(self, value: datetime) -> str:
+        return value.isoformat()
 
 
-class DocumentChunk(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+@dataclass(slots=True, kw_only=True)
+class DocumentChunk:
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
     document_id: str
     chunk_index: int
     content: str
     start_char: int
     end_char: int
     page_number: Optional[int] = None
-    metadata: dict = {}
+    metadata: dict = field(default_factory=dict)
 
 
 class ProcessingResult(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     document: Document
     chunks: List[DocumentChunk]
     success: bool
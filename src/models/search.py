@@ -1,15 +1,20 @@
+from dataclasses import dataclass
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from .document import DocumentChunk
 
 
-class SearchResult(BaseModel):
+@dataclass(slots=True, kw_only=True)
+class SearchResult:
     chunk: DocumentChunk
     relevance_score: float
     document_name: str
+    content_preview: str  # truncated chunk text for citations
     
 
 class SearchQuery(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     query: str
     top_k: int = 5
     relevance_threshold: float = 0.0
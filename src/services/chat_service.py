@@ -1,9 +1,11 @@
 import logging
+import time
+from collections import OrderedDict
 from typing import List, Dict, Optional
 from datetime import datetime
 
 from ..models.conversation import ConversationSession, ChatMessage, ChatResponse
-from .rag_service import RAGService
+from .rag_service import RAGService, ResponseStream
 
 logger = logging.getLogger(__name__)
 
@@ -11,10 +13,16 @@ logger = logging.getLogger(__name__)
 class ChatService:
     """Service for managing chat conversations and session state."""
     
-    def __init__(self, rag_service: RAGService):
+    def __init__(self, rag_service: RAGService, max_sessions: int = 256):
         self.rag_service = rag_service
-        self.sessions: Dict[str, ConversationSession] = {}
+        # Sessions in least- to most-recently-used order
+        self.sessions: OrderedDict[str, ConversationSession] = OrderedDict()
         self.current_session_id: Optional[str] = None
+        self._max_sessions = max_sessions
+        
+        # Running message counts so statistics don't rescan every session
+        self._user_messages = 0
+        self._assistant_messages = 0
     
     def create_session(self) -> ConversationSession:
         """Create a new conversation session."""
@@ -23,15 +31,26 @@ class ChatService:
         self.current_session_id = session.id
         
         logger.info(f"Created new chat session: {session.id}")
+        
+        # Evict the least recently used session once over capacity
+        if len(self.sessions) > self._max_sessions:
+            evicted_id, evicted = self.sessions.popitem(last=False)
+            self._discount_session(evicted)
+            logger.info(f"Evicted LRU session {evicted_id}")
+        
         return session
     
     def get_session(self, session_id: str) -> Optional[ConversationSession]:
         """Get a conversation session by ID."""
-        return self.sessions.get(session_id)
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+        return session
     
     def get_current_session(self) -> ConversationSession:
         """Get the current active session, creating one if needed."""
         if self.current_session_id and self.current_session_id in self.sessions:
+            self.sessions.move_to_end(self.current_session_id)
             return self.sessions[self.current_session_id]
         else:
             return self.create_session()
@@ -47,27 +66,15 @@ class ChatService:
         Returns:
             ChatResponse with AI response and sources
         """
-        # Get or create session
-        if session_id:
-            session = self.get_session(session_id)
-            if not session:
-                session = self.create_session()
-        else:
-            session = self.get_current_session()
+        session = self._resolve_session(session_id)
         
         try:
             # Add user message to session
             user_message = session.add_message(message, "user")
+            self._user_messages += 1
             
             # Prepare conversation history for context
-            recent_messages = session.get_recent_messages(10)
-            conversation_history = []
-            
-            for msg in recent_messages[:-1]:  # Exclude the current message
-                conversation_history.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
+            conversation_history = self._conversation_history(session)
             
             # Generate response using RAG
             chat_response = self.rag_service.generate_response(
@@ -77,8 +84,9 @@ class ChatService:
             
             # Add assistant response to session
             session.add_message(chat_response.content, "assistant")
+            self._assistant_messages += 1
             
-            logger.info(f"Processed message in session {session.id}")
+            logger.info("Processed message in session %s", session.id)
             return chat_response
         
         except Exception as e:
@@ -87,6 +95,7 @@ class ChatService:
             # Add error response to session
             error_response = f"I apologize, but I encountered an error: {str(e)}"
             session.add_message(error_response, "assistant")
+            self._assistant_messages += 1
             
             return ChatResponse(
                 content=error_response,
@@ -95,10 +104,66 @@ class ChatService:
                 token_usage=None
             )
     
+    def stream_message(self, message: str, session_id: Optional[str] = None) -> ResponseStream:
+        """
+        Send a message and stream the RAG answer as it is generated.
+        
+        The assistant reply is added to the session once the stream has
+        been consumed.
+        
+        Args:
+            message: User's message
+            session_id: Optional session ID, uses current session if not provided
+        
+        Returns:
+            ResponseStream yielding the answer text
+        """
+        session = self._resolve_session(session_id)
+        
+        session.add_message(message, "user")
+        self._user_messages += 1
+        
+        def record_reply(response: ChatResponse) -> None:
+            session.add_message(response.content, "assistant")
+            self._assistant_messages += 1
+            logger.info("Processed message in session %s", session.id)
+        
+        try:
+            return self.rag_service.stream_response(
+                query=message,
+                conversation_history=self._conversation_history(session),
+                on_complete=record_reply
+            )
+        
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            
+            # Stream the error response so it is recorded like a normal reply
+            error_response = f"I apologize, but I encountered an error: {str(e)}"
+            return ResponseStream(iter([error_response]), [], time.perf_counter(), record_reply)
+    
+    def _resolve_session(self, session_id: Optional[str]) -> ConversationSession:
+        """Get the requested or current session, creating one if needed."""
+        if session_id:
+            session = self.get_session(session_id)
+            if not session:
+                session = self.create_session()
+            return session
+        return self.get_current_session()
+    
+    def _conversation_history(self, session: ConversationSession) -> List[Dict[str, str]]:
+        """Recent messages before the latest one, formatted for the prompt."""
+        recent_messages = session.get_recent_messages(10)
+        return [
+            {"role": msg.role, "content": msg.content}
+            for msg in recent_messages[:-1]  # Exclude the current message
+        ]
+    
     def clear_session(self, session_id: Optional[str] = None) -> bool:
         """Clear a conversation session."""
         if session_id:
             if session_id in self.sessions:
+                self._discount_session(self.sessions[session_id])
                 del self.sessions[session_id]
                 if self.current_session_id == session_id:
                     self.current_session_id = None
@@ -115,6 +180,8 @@ class ChatService:
         """Clear all conversation sessions."""
         self.sessions.clear()
         self.current_session_id = None
+        self._user_messages = 0
+        self._assistant_messages = 0
         logger.info("Cleared all chat sessions")
     
     def get_session_history(self, session_id: Optional[str] = None) -> List[ChatMessage]:
@@ -124,24 +191,15 @@ class ChatService:
     
     def get_chat_statistics(self) -> Dict:
         """Get statistics about chat usage."""
-        total_sessions = len(self.sessions)
-        total_messages = sum(len(session.messages) for session in self.sessions.values())
-        
-        # Count messages by role
-        user_messages = 0
-        assistant_messages = 0
-        
-        for session in self.sessions.values():
-            for message in session.messages:
-                if message.role == "user":
-                    user_messages += 1
-                elif message.role == "assistant":
-                    assistant_messages += 1
-        
         return {
-            "total_sessions": total_sessions,
-            "total_messages": total_messages,
-            "user_messages": user_messages,
-            "assistant_messages": assistant_messages,
+            "total_sessions": len(self.sessions),
+            "total_messages": self._user_messages + self._assistant_messages,
+            "user_messages": self._user_messages,
+            "assistant_messages": self._assistant_messages,
             "active_session": self.current_session_id
-        }
\ No newline at end of file
+        }
+    
+    def _discount_session(self, session: ConversationSession) -> None:
+        """Remove a session's messages from the running counts."""
+        self._user_messages -= session.get_role_count("user")
+        self._assistant_messages -= session.get_role_count("assistant")
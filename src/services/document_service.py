@@ -1,165 +1,492 @@
 import logging
-import io
+import mmap
+import multiprocessing
 import os
-from typing import List, Optional
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, BinaryIO, Callable, Iterator, List, Optional, Tuple
 from datetime import datetime
 
 from ..models.document import Document, DocumentChunk, ProcessingResult
-from ..utils.pdf_utils import extract_text_from_pdf, validate_pdf_file
+from ..utils.pdf_utils import (
+    close_pdf,
+    compute_file_hash,
+    extract_page_range,
+    extract_text_from_pdf,
+    get_file_size,
+    join_page_texts,
+    open_and_validate_pdf,
+    page_count
+)
+from ..utils.locking import synchronized
 from ..utils.text_utils import create_text_chunks
 from config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Bytes copied at a time when spooling uploads for worker processes
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+
+def _process_document(
+    pdf_file: BinaryIO,
+    filename: str,
+    max_file_size: int,
+    chunk_size: int,
+    chunk_overlap: int,
+    extract_text: Optional[Callable[[BinaryIO, Any, str], Tuple[str, Optional[str]]]] = None
+) -> ProcessingResult:
+    """
+    Validate a PDF, extract its text and split it into chunks.
+    
+    Args:
+        pdf_file: Seekable binary file holding the upload
+        filename: Original filename
+        max_file_size: Maximum allowed file size in bytes
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Number of characters to overlap between chunks
+        extract_text: Called with the file, opened PDF and filename to extract
+            the text in place of extract_text_from_pdf; must close the PDF
+    
+    Returns:
+        ProcessingResult with document and chunks
+    """
+    logger.info(f"Processing uploaded file: {filename}")
+    
+    # Create document record
+    document = Document(
+        filename=filename,
+        file_size=get_file_size(pdf_file),
+        processing_status="processing"
+    )
+    
+    try:
+        # Validate file, keeping the parsed PDF for extraction
+        pdf_document, validation_error = open_and_validate_pdf(
+            pdf_file, filename, max_file_size
+        )
+        if validation_error:
+            document.processing_status = "failed"
+            document.error_message = validation_error
+            return ProcessingResult(
+                document=document,
+                chunks=[],
+                success=False,
+                error_message=validation_error
+            )
+        
+        # Extract text from PDF
+        if extract_text is None:
+            extracted_text, extraction_error = extract_text_from_pdf(pdf_document, filename)
+        else:
+            extracted_text, extraction_error = extract_text(pdf_file, pdf_document, filename)
+        
+        if extraction_error:
+            document.processing_status = "failed"
+            document.error_message = extraction_error
+            return ProcessingResult(
+                document=document,
+                chunks=[],
+                success=False,
+                error_message=extraction_error
+            )
+        
+        # Create text chunks
+        chunks = create_text_chunks(
+            text=extracted_text,
+            document_id=document.id,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        
+        # Update document status
+        document.processing_status = "completed"
+        document.total_chunks = len(chunks)
+        
+        logger.info(f"Successfully processed {filename}: {len(chunks)} chunks created")
+        
+        return ProcessingResult(
+            document=document,
+            chunks=chunks,
+            success=True
+        )
+    
+    except Exception as e:
+        error_msg = f"Unexpected error processing {filename}: {str(e)}"
+        logger.error(error_msg)
+        
+        document.processing_status = "failed"
+        document.error_message = error_msg
+        
+        return ProcessingResult(
+            document=document,
+            chunks=[],
+            success=False,
+            error_message=error_msg
+        )
+
+
+def _process_document_path(
+    path: str,
+    filename: str,
+    max_file_size: int,
+    chunk_size: int,
+    chunk_overlap: int,
+    upload_backend: str = "mmap"
+) -> ProcessingResult:
+    """Worker-process entry point for _process_document."""
+    with _open_spooled(path, upload_backend) as pdf_file:
+        return _process_document(
+            pdf_file,
+            filename,
+            max_file_size,
+            chunk_size,
+            chunk_overlap
+        )
+
+
+def _extract_page_range_path(
+    path: str,
+    filename: str,
+    start: int,
+    stop: int,
+    upload_backend: str = "mmap"
+) -> List[str]:
+    """Worker-process entry point for extract_page_range."""
+    with _open_spooled(path, upload_backend) as pdf_file:
+        return extract_page_range(pdf_file, filename, start, stop)
+
+
+@contextmanager
+def _open_spooled(path: str, upload_backend: str) -> Iterator[BinaryIO]:
+    """
+    Open an upload spooled to disk for a worker process.
+    
+    With the mmap backend the file is mapped read-only, so the PDF reader
+    reads straight from the page cache instead of through a file buffer.
+    """
+    with open(path, "rb") as pdf_file:
+        # Empty files cannot be mapped; validation reports them as usual
+        if upload_backend == "mmap" and os.fstat(pdf_file.fileno()).st_size > 0:
+            with mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+        else:
+            yield pdf_file
+
 
 class DocumentService:
     """Service for handling document upload, processing, and management."""
     
     def __init__(self):
         self.settings = get_settings()
+        # Guards the document stores and totals, shared by all sessions;
+        # parsing runs outside it and only storing the results takes it
+        self._lock = threading.RLock()
         self.processed_documents: dict[str, Document] = {}
         self.document_chunks: dict[str, List[DocumentChunk]] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        
+        # Running knowledge base totals, kept in step with the stores above
+        self._total_chunks = 0
+        self._total_size = 0
+        self._status_counts: Counter = Counter()
+        
+        # Documents newest first, rebuilt lazily after the store changes
+        self._documents_by_recency: Optional[Tuple[Document, ...]] = None
+        
+        # file_hash -> document_id, to recognise re-uploads of the same file
+        self._documents_by_hash: dict[str, str] = {}
     
     def process_uploaded_file(
         self,
-        file_data: bytes,
-        filename: str
+        pdf_file: BinaryIO,
+        filename: str,
+        file_hash: Optional[str] = None
     ) -> ProcessingResult:
         """
         Process an uploaded PDF file and extract text chunks.
         
         Args:
-            file_data: Raw file data
+            pdf_file: Seekable binary file, such as a Streamlit UploadedFile
             filename: Original filename
+            file_hash: SHA-256 of the file if already known, computed otherwise
         
         Returns:
             ProcessingResult with document and chunks
         """
-        logger.info(f"Processing uploaded file: {filename}")
-        
-        # Create document record
-        document = Document(
-            filename=filename,
-            file_size=len(file_data),
-            processing_status="processing"
+        file_hash = file_hash or compute_file_hash(pdf_file)
+        result = _process_document(
+            pdf_file,
+            filename,
+            self.settings.max_file_size,
+            self.settings.chunk_size,
+            self.settings.chunk_overlap,
+            extract_text=self._extract_text
         )
+        result.document.file_hash = file_hash
+        self._store_result(result)
+        return result
+    
+    def process_uploaded_files_batch(
+        self,
+        files: List[Tuple[BinaryIO, str]],
+        file_hashes: Optional[List[str]] = None
+    ) -> List[ProcessingResult]:
+        """
+        Process several uploaded PDF files in parallel worker processes.
+        
+        Args:
+            files: List of (pdf_file, filename) pairs
+            file_hashes: SHA-256 of each file if already known, computed otherwise
+        
+        Returns:
+            ProcessingResults in the same order as the input files
+        """
+        if file_hashes is None:
+            file_hashes = [compute_file_hash(pdf_file) for pdf_file, _ in files]
         
+        # Not worth the pool round-trip for a single file
+        if len(files) <= 1:
+            return [
+                self.process_uploaded_file(pdf_file, name, file_hash)
+                for (pdf_file, name), file_hash in zip(files, file_hashes)
+            ]
+        
+        logger.info(f"Processing {len(files)} uploaded files in parallel")
+        
+        executor = self._get_executor()
+        futures = {}
+        spooled_paths = []
         try:
-            # Validate file
-            validation_error = validate_pdf_file(
-                file_data, filename, self.settings.max_file_size
-            )
-            if validation_error:
-                document.processing_status = "failed"
-                document.error_message = validation_error
-                return ProcessingResult(
-                    document=document,
-                    chunks=[],
-                    success=False,
-                    error_message=validation_error
+            for i, (pdf_file, filename) in enumerate(files):
+                path = self._spool_upload(pdf_file)
+                spooled_paths.append(path)
+                future = executor.submit(
+                    _process_document_path,
+                    path,
+                    filename,
+                    self.settings.max_file_size,
+                    self.settings.chunk_size,
+                    self.settings.chunk_overlap,
+                    self.settings.upload_backend
                 )
+                futures[future] = i
             
-            # Extract text from PDF
-            pdf_file = io.BytesIO(file_data)
-            extracted_text, extraction_error = extract_text_from_pdf(pdf_file, filename)
-            
-            if extraction_error:
-                document.processing_status = "failed"
-                document.error_message = extraction_error
-                return ProcessingResult(
-                    document=document,
-                    chunks=[],
-                    success=False,
-                    error_message=extraction_error
+            results: List[Optional[ProcessingResult]] = [None] * len(files)
+            for future in as_completed(futures):
+                i = futures[future]
+                pdf_file, filename = files[i]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    error_msg = f"Unexpected error processing {filename}: {str(e)}"
+                    logger.error(error_msg)
+                    results[i] = ProcessingResult(
+                        document=Document(
+                            filename=filename,
+                            file_size=get_file_size(pdf_file),
+                            processing_status="failed",
+                            error_message=error_msg
+                        ),
+                        chunks=[],
+                        success=False,
+                        error_message=error_msg
+                    )
+                results[i].document.file_hash = file_hashes[i]
+                self._store_result(results[i])
+        
+        finally:
+            for path in spooled_paths:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove spooled upload {path}: {e}")
+        
+        return results
+    
+    def _extract_text(
+        self,
+        pdf_file: BinaryIO,
+        pdf_document: Any,
+        filename: str
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Extract the text of a single upload, spreading large PDFs over the worker processes.
+        
+        PDFs of at least page_range_threshold pages are split into one page
+        range per worker; each worker opens the spooled file itself and
+        extracts its range, and the ranges are joined in page order.
+        """
+        total_pages = page_count(pdf_document)
+        workers = self._worker_count()
+        threshold = self.settings.page_range_threshold
+        if not threshold or total_pages < threshold or workers <= 1:
+            return extract_text_from_pdf(pdf_document, filename)
+        
+        close_pdf(pdf_document)
+        range_size = -(-total_pages // workers)
+        logger.info(f"Extracting {total_pages} pages of {filename} in ranges of {range_size}")
+        
+        executor = self._get_executor()
+        path = self._spool_upload(pdf_file)
+        try:
+            futures = [
+                executor.submit(
+                    _extract_page_range_path,
+                    path,
+                    filename,
+                    start,
+                    min(start + range_size, total_pages),
+                    self.settings.upload_backend
                 )
-            
-            # Create text chunks
-            chunks = create_text_chunks(
-                text=extracted_text,
-                document_id=document.id,
-                chunk_size=self.settings.chunk_size,
-                chunk_overlap=self.settings.chunk_overlap
+                for start in range(0, total_pages, range_size)
+            ]
+            return join_page_texts([page for future in futures for page in future.result()])
+        
+        finally:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove spooled upload {path}: {e}")
+    
+    def _spool_upload(self, pdf_file: BinaryIO) -> str:
+        """
+        Copy an upload to a temporary file for a worker process to read.
+        
+        The file is copied in SPOOL_CHUNK_SIZE pieces, so the whole upload is
+        never held as one bytes object or pickled to the worker.
+        """
+        os.makedirs(self.settings.uploads_path, exist_ok=True)
+        pdf_file.seek(0)
+        with tempfile.NamedTemporaryFile(
+            dir=self.settings.uploads_path, suffix=".pdf", delete=False
+        ) as spooled:
+            shutil.copyfileobj(pdf_file, spooled, SPOOL_CHUNK_SIZE)
+        pdf_file.seek(0)
+        return spooled.name
+    
+    @synchronized
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create the PDF processing pool on first use."""
+        if self._executor is None:
+            # Spawned workers avoid forking the threaded Streamlit server
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._worker_count(),
+                mp_context=multiprocessing.get_context("spawn")
             )
-            
-            # Update document status
-            document.processing_status = "completed"
-            document.total_chunks = len(chunks)
-            
-            # Store in memory
+        return self._executor
+    
+    def _worker_count(self) -> int:
+        """Number of PDF worker processes."""
+        return self.settings.processing_workers or os.cpu_count() or 1
+    
+    @synchronized
+    def _store_result(self, result: ProcessingResult) -> None:
+        """Keep a successfully processed document and its chunks in memory."""
+        if result.success:
+            document = result.document
             self.processed_documents[document.id] = document
-            self.document_chunks[document.id] = chunks
-            
-            logger.info(f"Successfully processed {filename}: {len(chunks)} chunks created")
-            
-            return ProcessingResult(
-                document=document,
-                chunks=chunks,
-                success=True
-            )
-        
-        except Exception as e:
-            error_msg = f"Unexpected error processing {filename}: {str(e)}"
-            logger.error(error_msg)
-            
-            document.processing_status = "failed"
-            document.error_message = error_msg
+            self.document_chunks[document.id] = result.chunks
             
-            return ProcessingResult(
-                document=document,
-                chunks=[],
-                success=False,
-                error_message=error_msg
-            )
+            self._total_chunks += len(result.chunks)
+            self._total_size += document.file_size
+            self._status_counts[document.processing_status] += 1
+            self._documents_by_recency = None
+            if document.file_hash:
+                self._documents_by_hash[document.file_hash] = document.id
     
+    @synchronized
     def get_document(self, document_id: str) -> Optional[Document]:
         """Get a document by ID."""
         return self.processed_documents.get(document_id)
     
+    @synchronized
     def get_document_chunks(self, document_id: str) -> List[DocumentChunk]:
         """Get all chunks for a document."""
         return self.document_chunks.get(document_id, [])
     
-    def get_all_documents(self) -> List[Document]:
-        """Get all processed documents."""
-        return list(self.processed_documents.values())
+    @synchronized
+    def get_all_documents(self) -> Tuple[Document, ...]:
+        """Get a snapshot of all processed documents, safe to iterate while others change the store."""
+        return tuple(self.processed_documents.values())
     
+    @synchronized
+    def find_by_hash(self, file_hash: str) -> Optional[Document]:
+        """Get the processed document whose uploaded file had this SHA-256, if any."""
+        document_id = self._documents_by_hash.get(file_hash)
+        return self.processed_documents.get(document_id) if document_id else None
+    
+    @synchronized
+    def get_documents_by_recency(self) -> Tuple[Document, ...]:
+        """Get all processed documents, most recently uploaded first."""
+        # Sorted once per change to the store rather than on every rerun
+        if self._documents_by_recency is None:
+            self._documents_by_recency = tuple(sorted(
+                self.processed_documents.values(),
+                key=lambda document: document.upload_timestamp,
+                reverse=True
+            ))
+        return self._documents_by_recency
+    
+    @synchronized
+    def iter_all_chunks(self) -> Iterator[DocumentChunk]:
+        """Iterate over the chunks of all documents as they were when called."""
+        # Snapshot the per-document chunk lists, which are replaced rather
+        # than mutated, so documents added or removed meanwhile by other
+        # sessions do not break the iteration
+        return chain.from_iterable(tuple(self.document_chunks.values()))
+    
+    @synchronized
     def get_all_chunks(self) -> List[DocumentChunk]:
         """Get all chunks from all documents."""
-        all_chunks = []
-        for chunks in self.document_chunks.values():
-            all_chunks.extend(chunks)
-        return all_chunks
+        return list(self.iter_all_chunks())
     
+    @synchronized
     def remove_document(self, document_id: str) -> bool:
         """Remove a document and its chunks."""
         if document_id in self.processed_documents:
-            del self.processed_documents[document_id]
-            if document_id in self.document_chunks:
-                del self.document_chunks[document_id]
+            document = self.processed_documents.pop(document_id)
+            chunks = self.document_chunks.pop(document_id, [])
+            
+            self._total_chunks -= len(chunks)
+            self._total_size -= document.file_size
+            self._status_counts[document.processing_status] -= 1
+            if self._status_counts[document.processing_status] <= 0:
+                del self._status_counts[document.processing_status]
+            self._documents_by_recency = None
+            if self._documents_by_hash.get(document.file_hash) == document_id:
+                del self._documents_by_hash[document.file_hash]
+            
             logger.info(f"Removed document {document_id}")
             return True
         return False
     
+    @synchronized
     def clear_all_documents(self) -> None:
         """Clear all documents and chunks."""
         self.processed_documents.clear()
         self.document_chunks.clear()
+        self._total_chunks = 0
+        self._total_size = 0
+        self._status_counts.clear()
+        self._documents_by_recency = None
+        self._documents_by_hash.clear()
         logger.info("Cleared all documents")
     
+    @synchronized
     def get_knowledge_base_stats(self) -> dict:
         """Get statistics about the current knowledge base."""
         total_documents = len(self.processed_documents)
-        total_chunks = sum(len(chunks) for chunks in self.document_chunks.values())
-        total_size = sum(doc.file_size for doc in self.processed_documents.values())
-        
-        status_counts = {}
-        for doc in self.processed_documents.values():
-            status_counts[doc.processing_status] = status_counts.get(doc.processing_status, 0) + 1
         
         return {
             "total_documents": total_documents,
-            "total_chunks": total_chunks,
-            "total_size": total_size,
-            "status_counts": status_counts,
+            "total_chunks": self._total_chunks,
+            "total_size": self._total_size,
+            "status_counts": dict(self._status_counts),
             "last_updated": datetime.now().isoformat() if total_documents > 0 else None
         }
\ No newline at end of file
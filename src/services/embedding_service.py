@@ -1,24 +1,49 @@
 import logging
+import threading
 import time
-from typing import List, Dict, Optional
+from types import MappingProxyType
+from typing import List, Dict, Mapping, Optional
 import numpy as np
+import tiktoken
 
 from ..models.document import DocumentChunk
-from ..utils.openai_utils import OpenAIClient
+from ..utils.locking import synchronized
+from ..utils.openai_utils import get_openai_client
 from config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Per-request token budget for the OpenAI embeddings endpoint, with headroom
+MAX_BATCH_TOKENS = 8000
+
 
 class EmbeddingService:
     """Service for generating and managing vector embeddings using OpenAI."""
     
     def __init__(self, api_key: str):
         self.settings = get_settings()
-        self.openai_client = OpenAIClient(api_key)
-        self.chunk_embeddings: Dict[str, List[float]] = {}
+        self.openai_client = get_openai_client(api_key)
+        
+        # Embeddings are stored as one contiguous float32 matrix with a
+        # parallel chunk_id -> row index; removed rows are reclaimed lazily.
+        # The matrix is allocated with spare capacity, doubled when full, and
+        # only its first _row_count rows are in use
+        self._embedding_matrix: Optional[np.ndarray] = None
+        self._row_count = 0
+        self._id_to_row: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        
+        # Guards the matrix and index, shared by all sessions and by uploads
+        # embedded concurrently
+        self._lock = threading.RLock()
+        
+        # Read-only chunk_id -> embedding view handed out by get_all_embeddings
+        self._embeddings_view: Optional[Mapping[str, np.ndarray]] = None
+        
+        # Tokenizer for batch packing, loaded on first use
+        self._encoding: Optional[tiktoken.Encoding] = None
     
-    def generate_chunk_embeddings(self, chunks: List[DocumentChunk]) -> Dict[str, List[float]]:
+    def generate_chunk_embeddings(self, chunks: List[DocumentChunk]) -> Dict[str, np.ndarray]:
         """
         Generate embeddings for a list of document chunks.
         
@@ -39,17 +64,35 @@ class EmbeddingService:
             texts = [chunk.content for chunk in chunks]
             chunk_ids = [chunk.id for chunk in chunks]
             
-            # Generate embeddings in batch
-            embeddings = self.openai_client.get_embeddings_batch(
-                texts=texts,
-                model=self.settings.embedding_model
-            )
+            # Identical chunks (repeated headers, disclaimers) are embedded
+            # once; batches are deduplicated separately, so do it up front
+            unique_texts = list(dict.fromkeys(texts))
             
-            # Map chunk IDs to embeddings
-            chunk_embeddings = {}
-            for chunk_id, embedding in zip(chunk_ids, embeddings):
-                chunk_embeddings[chunk_id] = embedding
-                self.chunk_embeddings[chunk_id] = embedding
+            # Pack texts into request-sized batches; the client sends them
+            # concurrently within its request limit
+            batches = self._pack_batches(unique_texts)
+            by_text = dict(zip(
+                (text for batch in batches for text in batch),
+                self.openai_client.get_embeddings_packed(batches, model=self.settings.embedding_model)
+            ))
+            embeddings = [by_text[text] for text in texts]
+            
+            # Chunks the API rejected on their own are left out
+            if any(embedding is None for embedding in embeddings):
+                kept = [(chunk_id, embedding) for chunk_id, embedding in zip(chunk_ids, embeddings) if embedding is not None]
+                logger.warning(f"Skipping {len(embeddings) - len(kept)} chunks the embeddings API rejected")
+                chunk_ids = [chunk_id for chunk_id, _ in kept]
+                embeddings = [embedding for _, embedding in kept]
+                if not kept:
+                    return {}
+            
+            # Append to the embedding matrix and map chunk IDs to rows
+            with self._lock:
+                rows = self._append_rows(chunk_ids, np.stack(embeddings))
+                chunk_embeddings = {
+                    chunk_id: self._embedding_matrix[row]
+                    for chunk_id, row in zip(chunk_ids, rows)
+                }
             
             elapsed_time = time.time() - start_time
             logger.info(f"Generated {len(embeddings)} embeddings in {elapsed_time:.2f} seconds")
@@ -60,7 +103,45 @@ class EmbeddingService:
             logger.error(f"Error generating embeddings: {e}")
             raise
     
-    def generate_query_embedding(self, query: str) -> List[float]:
+    def _pack_batches(self, texts: List[str]) -> List[List[str]]:
+        """Greedily group texts into batches within the request token and embedding_batch_size limits."""
+        token_counts = self._count_tokens(texts)
+        
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        
+        for text, tokens in zip(texts, token_counts):
+            if current and (
+                current_tokens + tokens > MAX_BATCH_TOKENS
+                or len(current) >= self.settings.embedding_batch_size
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(text)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        
+        return batches
+    
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """Count tokens per text, estimating from length if no tokenizer is available."""
+        try:
+            if self._encoding is None:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.settings.embedding_model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            return [len(tokens) for tokens in self._encoding.encode_batch(texts)]
+        
+        except Exception as e:
+            logger.warning(f"Token counting unavailable, estimating from length: {e}")
+            return [len(text) // 3 + 1 for text in texts]
+    
+    def generate_query_embedding(self, query: str) -> np.ndarray:
         """
         Generate embedding for a search query.
         
@@ -68,7 +149,7 @@ class EmbeddingService:
             query: Search query text
         
         Returns:
-            Embedding vector as list of floats
+            float32 embedding vector
         """
         try:
             embedding = self.openai_client.get_embedding(
@@ -81,45 +162,106 @@ class EmbeddingService:
             logger.error(f"Error generating query embedding: {e}")
             raise
     
-    def get_chunk_embedding(self, chunk_id: str) -> Optional[List[float]]:
+    @synchronized
+    def get_chunk_embedding(self, chunk_id: str) -> Optional[np.ndarray]:
         """Get stored embedding for a specific chunk."""
-        return self.chunk_embeddings.get(chunk_id)
+        row = self._id_to_row.get(chunk_id)
+        if row is None:
+            return None
+        return self._embedding_matrix[row]
     
-    def get_all_embeddings(self) -> Dict[str, List[float]]:
-        """Get all stored chunk embeddings."""
-        return self.chunk_embeddings.copy()
+    @synchronized
+    def get_all_embeddings(self) -> Mapping[str, np.ndarray]:
+        """Get a read-only mapping of all stored chunk embeddings."""
+        if self._embeddings_view is None:
+            self._embeddings_view = MappingProxyType({
+                chunk_id: self._embedding_matrix[row]
+                for chunk_id, row in self._id_to_row.items()
+            })
+        return self._embeddings_view
     
+    @synchronized
     def remove_chunk_embedding(self, chunk_id: str) -> bool:
         """Remove embedding for a specific chunk."""
-        if chunk_id in self.chunk_embeddings:
-            del self.chunk_embeddings[chunk_id]
-            return True
-        return False
+        row = self._id_to_row.pop(chunk_id, None)
+        if row is None:
+            return False
+        
+        self._free_rows.append(row)
+        self._embeddings_view = None
+        
+        # Compact once more than half of the matrix is dead rows
+        if len(self._free_rows) > len(self._id_to_row):
+            self._compact()
+        return True
     
+    @synchronized
     def clear_all_embeddings(self) -> None:
         """Clear all stored embeddings."""
-        self.chunk_embeddings.clear()
+        self._embedding_matrix = None
+        self._row_count = 0
+        self._id_to_row.clear()
+        self._free_rows.clear()
+        self._invalidate_caches()
         logger.info("Cleared all embeddings")
     
+    @synchronized
     def get_embedding_stats(self) -> Dict:
         """Get statistics about stored embeddings."""
-        if not self.chunk_embeddings:
+        if not self._id_to_row:
             return {
                 "total_embeddings": 0,
                 "embedding_dimension": 0,
                 "memory_usage_mb": 0
             }
         
-        # Get embedding dimension from first embedding
-        first_embedding = next(iter(self.chunk_embeddings.values()))
-        embedding_dim = len(first_embedding)
-        
-        # Estimate memory usage (rough calculation)
-        total_floats = len(self.chunk_embeddings) * embedding_dim
-        memory_mb = (total_floats * 4) / (1024 * 1024)  # 4 bytes per float
+        memory_mb = self._embedding_matrix[:self._row_count].nbytes / (1024 * 1024)
         
         return {
-            "total_embeddings": len(self.chunk_embeddings),
-            "embedding_dimension": embedding_dim,
+            "total_embeddings": len(self._id_to_row),
+            "embedding_dimension": self._embedding_matrix.shape[1],
             "memory_usage_mb": round(memory_mb, 2)
-        }
\ No newline at end of file
+        }
+    
+    def _append_rows(self, chunk_ids: List[str], vectors: np.ndarray) -> List[int]:
+        """Append embedding rows to the matrix and return their row indices."""
+        start = self._row_count
+        end = start + len(vectors)
+        if self._embedding_matrix is None or end > len(self._embedding_matrix):
+            # Grow geometrically so repeated uploads copy the matrix
+            # a logarithmic number of times, not once per upload
+            capacity = max(end, 2 * start)
+            matrix = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            if start:
+                matrix[:start] = self._embedding_matrix[:start]
+            self._embedding_matrix = matrix
+        self._embedding_matrix[start:end] = vectors
+        self._row_count = end
+        self._invalidate_caches()
+        
+        rows = list(range(start, start + len(chunk_ids)))
+        for chunk_id, row in zip(chunk_ids, rows):
+            # Re-embedding a chunk leaves its previous row dead
+            previous = self._id_to_row.get(chunk_id)
+            if previous is not None:
+                self._free_rows.append(previous)
+            self._id_to_row[chunk_id] = row
+        return rows
+    
+    def _compact(self) -> None:
+        """Drop dead rows from the embedding matrix and renumber live rows."""
+        if not self._id_to_row:
+            self.clear_all_embeddings()
+            return
+        
+        chunk_ids = list(self._id_to_row)
+        live_rows = np.fromiter(self._id_to_row.values(), dtype=np.int64, count=len(chunk_ids))
+        self._embedding_matrix = self._embedding_matrix[live_rows]
+        self._row_count = len(live_rows)
+        self._id_to_row = {chunk_id: row for row, chunk_id in enumerate(chunk_ids)}
+        self._free_rows.clear()
+        self._invalidate_caches()
+    
+    def _invalidate_caches(self) -> None:
+        """Drop cached derived views after the stored embeddings change."""
+        self._embeddings_view = None
\ No newline at end of file
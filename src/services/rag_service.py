@@ -1,24 +1,178 @@
+import asyncio
 import logging
+import threading
 import time
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from typing import Callable, Generator, Iterable, List, Dict, Any, Optional, Tuple
+import faiss
+import numpy as np
 
 from ..models.conversation import ChatResponse, SourceCitation
-from ..models.search import SearchQuery
-from ..utils.openai_utils import OpenAIClient
+from ..models.search import SearchQuery, SearchResponse, SearchResult
+from ..utils.openai_utils import get_openai_client
 from .vector_service import VectorService
 from config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
 
+class ResponseStream:
+    """
+    Iterator over a streamed RAG answer.
+    
+    Yields text as it arrives; once exhausted, ``response`` holds the full
+    ChatResponse and the completion callback has been called with it.
+    start_time is a time.perf_counter() reading.
+    """
+    
+    def __init__(
+        self,
+        chunks: Generator[str, None, Optional[Dict[str, Any]]],
+        sources: List[SourceCitation],
+        start_time: float,
+        on_complete: Optional[Callable[[ChatResponse], None]] = None
+    ):
+        self.sources = sources
+        self.response: Optional[ChatResponse] = None
+        self.error: Optional[Exception] = None
+        self._chunks = chunks
+        self._start_time = start_time
+        self._on_complete = on_complete
+    
+    def __iter__(self):
+        parts = []
+        token_usage = None
+        sources = self.sources
+        
+        try:
+            while True:
+                try:
+                    text = next(self._chunks)
+                except StopIteration as stop:
+                    token_usage = stop.value
+                    break
+                parts.append(text)
+                yield text
+        
+        except Exception as e:
+            logger.error(f"Error streaming RAG response: {e}")
+            self.error = e
+            error_text = f"I apologize, but I encountered an error while processing your question: {str(e)}"
+            parts = [error_text]
+            sources = []
+            yield error_text
+        
+        self.response = ChatResponse(
+            content="".join(parts),
+            sources=sources,
+            response_time=time.perf_counter() - self._start_time,
+            token_usage=token_usage
+        )
+        logger.info("Streamed RAG response in %.2fs with %d sources", self.response.response_time, len(sources))
+        
+        if self._on_complete:
+            self._on_complete(self.response)
+
+
+class _ResponseCache:
+    """
+    Semantic cache of answers keyed by question embeddings.
+    
+    Past questions live in a small flat inner-product index; a new question
+    whose normalized embedding is close enough to a cached one reuses its
+    answer. Entries are evicted least recently used first, and the whole
+    cache is dropped when the knowledge base version changes.
+    """
+    
+    def __init__(self, max_entries: int, threshold: float):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.index: Optional[faiss.IndexIDMap2] = None
+        self.entries: OrderedDict[int, ChatResponse] = OrderedDict()  # FAISS id -> answer
+        self._next_id = 0
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    def _reset(self, version: int) -> None:
+        """Drop all entries, keeping answers only for the given knowledge base version."""
+        if self.index is not None:
+            self.index.reset()
+        self.entries.clear()
+        self._version = version
+    
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.array([embedding], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+    
+    def lookup(self, embedding: np.ndarray, version: int) -> Optional[ChatResponse]:
+        """
+        Find the answer to the most similar cached question.
+        
+        Returns:
+            The cached ChatResponse, or None if no question is similar enough
+        """
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            if not self.entries:
+                return None
+            
+            scores, ids = self.index.search(self._normalize(embedding), 1)
+            entry_id = int(ids[0][0])
+            if scores[0][0] < self.threshold or entry_id not in self.entries:
+                return None
+            
+            self.entries.move_to_end(entry_id)
+            return self.entries[entry_id]
+    
+    def store(self, embedding: np.ndarray, response: ChatResponse, version: int) -> None:
+        """Cache the answer to a question, evicting the least recently used if full."""
+        if self.max_entries <= 0:
+            return
+        
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(len(embedding)))
+            
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(self._normalize(embedding), np.array([entry_id], dtype=np.int64))
+            self.entries[entry_id] = response
+            
+            while len(self.entries) > self.max_entries:
+                evicted_id, _ = self.entries.popitem(last=False)
+                self.index.remove_ids(np.array([evicted_id], dtype=np.int64))
+
+
 class RAGService:
     """Service implementing Retrieval-Augmented Generation pipeline."""
     
     def __init__(self, api_key: str, vector_service: VectorService):
         self.settings = get_settings()
-        self.openai_client = OpenAIClient(api_key)
+        self.openai_client = get_openai_client(api_key)
         self.vector_service = vector_service
         
+        # LRU cache of query embeddings keyed by normalized query text; the
+        # service is shared across sessions, so access is locked
+        self._query_embeddings: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+        
+        # Answers to recent stand-alone questions, reused for near-duplicates;
+        # shared by every session, so off unless response_cache_size is set
+        self.response_cache = _ResponseCache(
+            self.settings.response_cache_size,
+            self.settings.response_cache_threshold
+        )
+        
+        # Cross-encoder for reranking retrieved chunks, loaded on first use
+        self._reranker = None
+        self._reranker_unavailable = False
+        self._reranker_lock = threading.Lock()
+        
         # System prompt for RAG responses
         self.system_prompt = """You are a helpful AI assistant that answers questions based on provided document context. 
 
@@ -33,7 +187,8 @@ Guidelines:
     def generate_response(
         self,
         query: str,
-        conversation_history: List[Dict[str, str]] = None
+        conversation_history: List[Dict[str, str]] = None,
+        additional_queries: Optional[List[str]] = None
     ) -> ChatResponse:
         """
         Generate a response using retrieval-augmented generation.
@@ -41,72 +196,31 @@ Guidelines:
         Args:
             query: User's question
             conversation_history: Recent conversation messages for context
+            additional_queries: Alternative phrasings of the question whose
+                matches are pooled with those of the question itself
         
         Returns:
             ChatResponse with answer and source citations
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
-            # Step 1: Generate query embedding
-            query_embedding = self.openai_client.get_embedding(
-                text=query,
-                model=self.settings.embedding_model
-            )
+            search_texts = [query] + list(additional_queries or [])
+            index_version = self.vector_service.version
             
-            # Step 2: Perform semantic search
-            search_query = SearchQuery(
-                query=query,
-                top_k=self.settings.retrieval_count,
-                relevance_threshold=0.1  # Low threshold to get diverse results
-            )
+            # Step 1: Generate query embeddings, reusing cached ones
+            query_embeddings = self._embed_queries(search_texts)
             
-            search_response = self.vector_service.search(query_embedding, search_query)
-            
-            # Step 3: Prepare context from retrieved chunks
-            context_chunks = []
-            source_citations = []
-            
-            for result in search_response.results:
-                chunk = result.chunk
-                context_chunks.append({
-                    "content": chunk.content,
-                    "document": result.document_name,
-                    "score": result.relevance_score
-                })
-                
-                # Create source citation
-                citation = SourceCitation(
-                    document_id=chunk.document_id,
-                    document_name=result.document_name,
-                    chunk_id=chunk.id,
-                    content=chunk.content[:200] + "..." if len(chunk.content) > 200 else chunk.content,
-                    relevance_score=result.relevance_score,
-                    page_number=chunk.page_number
-                )
-                source_citations.append(citation)
-            
-            # Step 4: Build prompt with context
-            context_text = self._build_context_text(context_chunks)
-            
-            # Step 5: Prepare messages for LLM
-            messages = [
-                {"role": "system", "content": self.system_prompt}
-            ]
-            
-            # Add conversation history if provided
-            if conversation_history:
-                messages.extend(conversation_history[-6:])  # Last 6 messages for context
-            
-            # Add current query with context
-            user_message = f"""Context from documents:
-{context_text}
-
-Question: {query}
-
-Please answer the question based on the provided context. If the context doesn't contain sufficient information to answer the question, please state that clearly."""
+            cacheable = self._is_cacheable(conversation_history, additional_queries)
+            if cacheable:
+                cached = self._cached_response(query_embeddings[0], index_version, start_time)
+                if cached:
+                    return cached
             
-            messages.append({"role": "user", "content": user_message})
+            # Steps 2-5: Retrieve context and build the prompt
+            messages, source_citations = self._prepare_messages(
+                query, search_texts, query_embeddings, conversation_history
+            )
             
             # Step 6: Generate response
             response_text, token_usage = self.openai_client.chat_completion(
@@ -116,20 +230,23 @@ Please answer the question based on the provided context. If the context doesn't
                 max_tokens=self.settings.max_tokens
             )
             
-            response_time = time.time() - start_time
+            response_time = time.perf_counter() - start_time
             
-            logger.info(f"Generated RAG response in {response_time:.2f}s with {len(source_citations)} sources")
+            logger.info("Generated RAG response in %.2fs with %d sources", response_time, len(source_citations))
             
-            return ChatResponse(
+            response = ChatResponse(
                 content=response_text,
                 sources=source_citations,
                 response_time=response_time,
                 token_usage=token_usage
             )
+            if cacheable:
+                self.response_cache.store(query_embeddings[0], response, index_version)
+            return response
         
         except Exception as e:
             logger.error(f"Error generating RAG response: {e}")
-            response_time = time.time() - start_time
+            response_time = time.perf_counter() - start_time
             
             return ChatResponse(
                 content=f"I apologize, but I encountered an error while processing your question: {str(e)}",
@@ -138,19 +255,389 @@ Please answer the question based on the provided context. If the context doesn't
                 token_usage=None
             )
     
-    def _build_context_text(self, context_chunks: List[Dict]) -> str:
-        """Build formatted context text from retrieved chunks."""
-        if not context_chunks:
-            return "No relevant context found in the uploaded documents."
+    async def generate_response_async(
+        self,
+        query: str,
+        conversation_history: List[Dict[str, str]] = None,
+        additional_queries: Optional[List[str]] = None
+    ) -> ChatResponse:
+        """
+        Async variant of generate_response for use on the client's event loop.
+        
+        Several concurrent calls share the async OpenAI connection pool, and
+        the vector search runs in a worker thread so the loop keeps serving
+        other requests.
+        
+        Args:
+            query: User's question
+            conversation_history: Recent conversation messages for context
+            additional_queries: Alternative phrasings of the question
+        
+        Returns:
+            ChatResponse with answer and source citations
+        """
+        start_time = time.perf_counter()
+        
+        try:
+            search_texts = [query] + list(additional_queries or [])
+            index_version = self.vector_service.version
+            
+            query_embeddings = await self._embed_queries_async(search_texts)
+            
+            cacheable = self._is_cacheable(conversation_history, additional_queries)
+            if cacheable:
+                cached = self._cached_response(query_embeddings[0], index_version, start_time)
+                if cached:
+                    return cached
+            
+            messages, source_citations = await asyncio.to_thread(
+                self._prepare_messages,
+                query, search_texts, query_embeddings, conversation_history
+            )
+            
+            response_text, token_usage = await self.openai_client.chat_completion_async(
+                messages=messages,
+                model=self.settings.chat_model,
+                temperature=self.settings.temperature,
+                max_tokens=self.settings.max_tokens
+            )
+            
+            response_time = time.perf_counter() - start_time
+            
+            logger.info("Generated RAG response in %.2fs with %d sources", response_time, len(source_citations))
+            
+            response = ChatResponse(
+                content=response_text,
+                sources=source_citations,
+                response_time=response_time,
+                token_usage=token_usage
+            )
+            if cacheable:
+                self.response_cache.store(query_embeddings[0], response, index_version)
+            return response
+        
+        except Exception as e:
+            logger.error(f"Error generating RAG response: {e}")
+            
+            return ChatResponse(
+                content=f"I apologize, but I encountered an error while processing your question: {str(e)}",
+                sources=[],
+                response_time=time.perf_counter() - start_time,
+                token_usage=None
+            )
+    
+    def stream_response(
+        self,
+        query: str,
+        conversation_history: List[Dict[str, str]] = None,
+        on_complete: Optional[Callable[[ChatResponse], None]] = None
+    ) -> "ResponseStream":
+        """
+        Retrieve context and stream the answer as it is generated.
+        
+        Args:
+            query: User's question
+            conversation_history: Recent conversation messages for context
+            on_complete: Called with the final ChatResponse once the stream ends
+        
+        Returns:
+            ResponseStream yielding answer text; its response is set when exhausted
+        """
+        start_time = time.perf_counter()
+        index_version = self.vector_service.version
+        query_embedding = self._embed_queries([query])[0]
+        
+        cacheable = self._is_cacheable(conversation_history)
+        if cacheable:
+            cached = self._cached_response(query_embedding, index_version, start_time)
+            if cached:
+                return ResponseStream(iter([cached.content]), cached.sources, start_time, on_complete)
+        
+        messages, source_citations = self._prepare_messages(
+            query, [query], [query_embedding], conversation_history
+        )
+        
+        chunks = self.openai_client.chat_completion_stream(
+            messages=messages,
+            model=self.settings.chat_model,
+            temperature=self.settings.temperature,
+            max_tokens=self.settings.max_tokens
+        )
+        
+        def complete(response: ChatResponse) -> None:
+            if cacheable and stream.error is None:
+                self.response_cache.store(query_embedding, response, index_version)
+            if on_complete:
+                on_complete(response)
+        
+        stream = ResponseStream(chunks, source_citations, start_time, complete)
+        return stream
+    
+    @staticmethod
+    def _is_cacheable(
+        conversation_history: Optional[List[Dict[str, str]]],
+        additional_queries: Optional[List[str]] = None
+    ) -> bool:
+        """Only stand-alone questions have answers that can be reused for another turn."""
+        return not conversation_history and not additional_queries
+    
+    def _cached_response(
+        self,
+        query_embedding: np.ndarray,
+        index_version: int,
+        start_time: float
+    ) -> Optional[ChatResponse]:
+        """Answer from the semantic cache, timed as this lookup, if a similar question was asked."""
+        cached = self.response_cache.lookup(query_embedding, index_version)
+        if cached is None:
+            return None
+        
+        response_time = time.perf_counter() - start_time
+        logger.info("Answered from response cache in %.2fs", response_time)
+        return ChatResponse(
+            content=cached.content,
+            sources=cached.sources,
+            response_time=response_time,
+            token_usage=None
+        )
+    
+    @staticmethod
+    def _normalize_query(text: str) -> str:
+        """Collapse whitespace and case so trivially different queries share an embedding."""
+        return " ".join(text.split()).lower()
+    
+    def _embed_queries(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Embed query texts, requesting only those not already cached, in one call.
+        
+        Raises:
+            ValueError: If the API rejects any of the query texts
+        """
+        keys = [self._normalize_query(text) for text in texts]
+        embeddings, missing = self._lookup_query_embeddings(keys, texts)
+        
+        if len(missing) == 1:
+            key, text = next(iter(missing.items()))
+            embeddings[key] = self.openai_client.get_embedding(
+                text=text,
+                model=self.settings.embedding_model
+            )
+        elif missing:
+            embeddings.update(zip(missing, self.openai_client.get_embeddings_batch(
+                texts=list(missing.values()),
+                model=self.settings.embedding_model
+            )))
+        
+        return self._finish_query_embeddings(keys, embeddings, missing)
+    
+    async def _embed_queries_async(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Async variant of _embed_queries on the client's event loop.
+        
+        Raises:
+            ValueError: If the API rejects any of the query texts
+        """
+        keys = [self._normalize_query(text) for text in texts]
+        embeddings, missing = self._lookup_query_embeddings(keys, texts)
+        
+        if missing:
+            embeddings.update(zip(missing, await self.openai_client.get_embeddings_batch_async(
+                list(missing.values()), model=self.settings.embedding_model
+            )))
+        
+        return self._finish_query_embeddings(keys, embeddings, missing)
+    
+    def _finish_query_embeddings(
+        self,
+        keys: List[str],
+        embeddings: Dict[str, Optional[np.ndarray]],
+        missing: Dict[str, str]
+    ) -> List[np.ndarray]:
+        """
+        Cache newly fetched query embeddings and return them in key order.
+        
+        Rejected texts come back as None; only real vectors are cached, so a
+        rejected query is sent to the API again next time.
+        
+        Raises:
+            ValueError: If any of the missing query texts was rejected
+        """
+        self._store_query_embeddings(
+            [key for key in missing if embeddings[key] is not None], embeddings
+        )
+        
+        rejected = [missing[key] for key in missing if embeddings[key] is None]
+        if rejected:
+            raise ValueError(f"Could not embed queries: {rejected}")
         
-        context_parts = []
-        for i, chunk in enumerate(context_chunks, 1):
-            context_parts.append(
-                f"[Document: {chunk['document']}, Relevance: {chunk['score']:.3f}]\n"
-                f"{chunk['content']}\n"
+        return [embeddings[key] for key in keys]
+    
+    def _lookup_query_embeddings(
+        self,
+        keys: List[str],
+        texts: List[str]
+    ) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+        """
+        Look up cached embeddings of normalized query texts.
+        
+        Args:
+            keys: Normalized query texts used as cache keys
+            texts: Original query texts, in the same order as keys
+            
+        Returns:
+            Cached embeddings by key, and the original text to embed for
+            each key still missing
+        """
+        embeddings = {}
+        missing = {}
+        with self._query_embeddings_lock:
+            for key, text in zip(keys, texts):
+                if key in embeddings or key in missing:
+                    continue
+                embedding = self._query_embeddings.get(key)
+                if embedding is None:
+                    missing[key] = text
+                else:
+                    self._query_embeddings.move_to_end(key)
+                    embeddings[key] = embedding
+        return embeddings, missing
+    
+    def _store_query_embeddings(self, keys: Iterable[str], embeddings: Dict[str, np.ndarray]) -> None:
+        """Cache newly computed query embeddings, evicting the least recently used."""
+        with self._query_embeddings_lock:
+            for key in keys:
+                self._query_embeddings[key] = embeddings[key]
+            while len(self._query_embeddings) > self.settings.query_embedding_cache_size:
+                self._query_embeddings.popitem(last=False)
+    
+    def _prepare_messages(
+        self,
+        query: str,
+        search_texts: List[str],
+        query_embeddings: List[np.ndarray],
+        conversation_history: Optional[List[Dict[str, str]]]
+    ) -> Tuple[List[Dict[str, str]], List[SourceCitation]]:
+        """Search for context and build the chat messages and source citations."""
+        # Step 2: Perform semantic search, over-fetching candidates when a
+        # reranker will pick the final chunks
+        reranker = self._get_reranker()
+        top_k = self.settings.rerank_candidates if reranker else self.settings.retrieval_count
+        search_queries = [
+            SearchQuery(
+                query=text,
+                top_k=top_k,
+                relevance_threshold=0.1  # Low threshold to get diverse results
+            )
+            for text in search_texts
+        ]
+        
+        if len(search_queries) == 1:
+            search_results = self.vector_service.search(
+                query_embeddings[0], search_queries[0]
+            ).results
+        else:
+            search_responses = self.vector_service.search_batch(
+                np.asarray(query_embeddings, dtype=np.float32), search_queries
             )
+            search_results = self._merge_search_results(search_responses, top_k)
+        
+        if reranker and search_results:
+            search_results = self._rerank(reranker, query, search_results)
+        
+        # Step 3: Prepare source citations for the retrieved chunks
+        source_citations = []
+        
+        for result in search_results:
+            chunk = result.chunk
+            
+            # Create source citation
+            citation = SourceCitation(
+                document_id=chunk.document_id,
+                document_name=result.document_name,
+                chunk_id=chunk.id,
+                content=result.content_preview,
+                relevance_score=result.relevance_score,
+                page_number=chunk.page_number
+            )
+            source_citations.append(citation)
+        
+        # Step 4: Build prompt with context
+        context_text = self._build_context_text(search_results)
+        
+        # Step 5: Prepare messages for LLM
+        messages = [
+            {"role": "system", "content": self.system_prompt}
+        ]
+        
+        # Add conversation history if provided
+        if conversation_history:
+            messages.extend(conversation_history[-6:])  # Last 6 messages for context
+        
+        # Add current query with context
+        user_message = f"""Context from documents:
+{context_text}
+
+Question: {query}
+
+Please answer the question based on the provided context. If the context doesn't contain sufficient information to answer the question, please state that clearly."""
+        
+        messages.append({"role": "user", "content": user_message})
+        
+        return messages, source_citations
+    
+    def _merge_search_results(self, search_responses: List[SearchResponse], limit: int) -> List[SearchResult]:
+        """Pool results from several searches, keeping each chunk's best score."""
+        best: Dict[str, SearchResult] = {}
+        for response in search_responses:
+            for result in response.results:
+                current = best.get(result.chunk.id)
+                if current is None or result.relevance_score > current.relevance_score:
+                    best[result.chunk.id] = result
+        
+        merged = sorted(best.values(), key=lambda result: result.relevance_score, reverse=True)
+        return merged[:limit]
+    
+    def _get_reranker(self):
+        """
+        Return the configured cross-encoder, loading it on first use.
+        
+        Returns:
+            A sentence-transformers CrossEncoder, or None if reranking is off
+            or the model cannot be loaded
+        """
+        if not self.settings.rerank_model or self._reranker_unavailable:
+            return None
+        
+        with self._reranker_lock:
+            if self._reranker is None and not self._reranker_unavailable:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self._reranker = CrossEncoder(self.settings.rerank_model)
+                    logger.info(f"Loaded reranker {self.settings.rerank_model}")
+                except Exception as e:
+                    # Optional dependency; answer from vector search alone
+                    logger.warning(f"Reranking disabled, could not load {self.settings.rerank_model}: {e}")
+                    self._reranker_unavailable = True
+        return self._reranker
+    
+    def _rerank(self, reranker, query: str, search_results: List[SearchResult]) -> List[SearchResult]:
+        """Order candidates by cross-encoder score in one batch and keep the best."""
+        pairs = [(query, result.chunk.content) for result in search_results]
+        scores = reranker.predict(pairs, batch_size=32, show_progress_bar=False)
+        
+        order = np.argsort(-np.asarray(scores))[:self.settings.retrieval_count]
+        return [search_results[i] for i in order]
+    
+    def _build_context_text(self, search_results: List[SearchResult]) -> str:
+        """Build formatted context text from retrieved chunks in a single join."""
+        if not search_results:
+            return "No relevant context found in the uploaded documents."
         
-        return "\n---\n".join(context_parts)
+        return "\n---\n".join(
+            f"[Document: {result.document_name}, Relevance: {result.relevance_score:.3f}]\n"
+            f"{result.chunk.content}\n"
+            for result in search_results
+        )
     
     def get_simple_answer(self, query: str) -> str:
         """
@@ -1,28 +1,373 @@
+import json
 import logging
 import os
 import pickle
+import shutil
+import threading
 import time
-from typing import List, Dict, Tuple, Optional
+from concurrent.futures import Future
+from typing import Callable, List, Dict, Tuple, Optional
 import numpy as np
 import faiss
+import pyarrow as pa
 
 from ..models.document import DocumentChunk
 from ..models.search import SearchResult, SearchQuery, SearchResponse
+from ..utils.locking import synchronized
 from config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Characters of chunk text shown in source citations
+CONTENT_PREVIEW_CHARS = 200
+
+# Bits per PQ sub-quantizer code; training needs 2**PQ_NBITS points
+PQ_NBITS = 8
+
+
+class _SearchBatcher:
+    """
+    Coalesces single-query searches that arrive within a short window.
+    
+    The first caller of a window waits for it to close, runs every pending
+    query in one batch and hands each caller its own response.
+    """
+    
+    def __init__(
+        self,
+        run_batch: Callable[[np.ndarray, List[SearchQuery]], List[SearchResponse]],
+        window_seconds: float
+    ):
+        self._run_batch = run_batch
+        self._window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[np.ndarray, SearchQuery, Future]] = []
+    
+    def submit(self, query_vector: np.ndarray, query: SearchQuery) -> SearchResponse:
+        """Queue a query and block until its batch has been searched."""
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((query_vector, query, future))
+            is_leader = len(self._pending) == 1
+        
+        if is_leader:
+            time.sleep(self._window_seconds)
+            with self._lock:
+                batch, self._pending = self._pending, []
+            
+            try:
+                responses = self._run_batch(
+                    np.vstack([vector for vector, _, _ in batch]),
+                    [pending_query for _, pending_query, _ in batch]
+                )
+                for (_, _, pending_future), response in zip(batch, responses):
+                    pending_future.set_result(response)
+            except Exception as e:
+                for _, _, pending_future in batch:
+                    pending_future.set_exception(e)
+        
+        return future.result()
+
+
+class _ChunkColumns:
+    """
+    Chunk metadata stored column-wise, one row per FAISS id.
+    
+    Chunk text is kept in a single UTF-8 buffer addressed by an offsets
+    column, so the store saves as an Arrow table and search results are
+    built by indexing rather than walking Python objects. A loaded store
+    uses the table's buffers directly, copying them only when appended to.
+    Citation previews are precomputed at ingest in a second text column.
+    """
+    
+    _ARRAY_FIELDS = (
+        "chunk_ids",
+        "document_ids",
+        "chunk_indexes",
+        "page_numbers",
+        "start_chars",
+        "end_chars",
+        "content_offsets",
+    )
+    # Columns stored as-is in the Arrow table; content and previews are
+    # stored as large_string columns built from their offsets and buffers
+    _TABLE_FIELDS = _ARRAY_FIELDS[:-1]
+    
+    def __init__(self):
+        self.clear()
+    
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+    
+    def clear(self) -> None:
+        """Drop all rows."""
+        self.chunk_ids = np.array([], dtype=str)
+        self.document_ids = np.array([], dtype=str)
+        self.chunk_indexes = np.array([], dtype=np.int32)
+        self.page_numbers = np.array([], dtype=np.int32)  # -1 when unknown
+        self.start_chars = np.array([], dtype=np.int64)
+        self.end_chars = np.array([], dtype=np.int64)
+        self.content_offsets = np.zeros(1, dtype=np.int64)
+        self.content_buffer = bytearray()
+        self.preview_offsets = np.zeros(1, dtype=np.int64)
+        self.preview_buffer = bytearray()
+    
+    def append(self, chunks: List[DocumentChunk]) -> None:
+        """Append one row per chunk, in FAISS id order."""
+        if not chunks:
+            return
+        
+        # Arrow string columns must be valid UTF-8, so lone surrogates are
+        # stored as "?", one character each to keep chunk offsets aligned
+        encoded = [chunk.content.encode("utf-8", "replace") for chunk in chunks]
+        self.content_offsets, self.content_buffer = self._extend_text(
+            self.content_offsets, self.content_buffer, encoded
+        )
+        self.preview_offsets, self.preview_buffer = self._extend_text(
+            self.preview_offsets,
+            self.preview_buffer,
+            [self._preview(chunk.content, content) for chunk, content in zip(chunks, encoded)]
+        )
+        
+        self.chunk_ids = np.concatenate([self.chunk_ids, [chunk.id for chunk in chunks]])
+        self.document_ids = np.concatenate([self.document_ids, [chunk.document_id for chunk in chunks]])
+        self.chunk_indexes = np.concatenate([
+            self.chunk_indexes,
+            np.array([chunk.chunk_index for chunk in chunks], dtype=np.int32)
+        ])
+        self.page_numbers = np.concatenate([
+            self.page_numbers,
+            np.array([-1 if chunk.page_number is None else chunk.page_number for chunk in chunks], dtype=np.int32)
+        ])
+        self.start_chars = np.concatenate([
+            self.start_chars,
+            np.array([chunk.start_char for chunk in chunks], dtype=np.int64)
+        ])
+        self.end_chars = np.concatenate([
+            self.end_chars,
+            np.array([chunk.end_char for chunk in chunks], dtype=np.int64)
+        ])
+    
+    def extend(self, other: "_ChunkColumns") -> None:
+        """Append all rows of another store."""
+        for name in self._TABLE_FIELDS:
+            setattr(self, name, np.concatenate([getattr(self, name), getattr(other, name)]))
+        self.content_offsets, self.content_buffer = self._concat_text(
+            self.content_offsets, self.content_buffer, other.content_offsets, other.content_buffer
+        )
+        self.preview_offsets, self.preview_buffer = self._concat_text(
+            self.preview_offsets, self.preview_buffer, other.preview_offsets, other.preview_buffer
+        )
+    
+    def keep_rows(self, keep: np.ndarray) -> None:
+        """Drop every row whose entry in a boolean mask is False, preserving order."""
+        for name in self._TABLE_FIELDS:
+            column = getattr(self, name)
+            if isinstance(column, pa.Array):
+                column = column.filter(pa.array(keep))  # loaded string column
+            else:
+                column = column[keep]
+            setattr(self, name, column)
+        self.content_offsets, self.content_buffer = self._select_text(
+            self.content_offsets, self.content_buffer, keep
+        )
+        self.preview_offsets, self.preview_buffer = self._select_text(
+            self.preview_offsets, self.preview_buffer, keep
+        )
+    
+    @staticmethod
+    def _select_text(
+        offsets: np.ndarray,
+        buffer: bytearray,
+        keep: np.ndarray
+    ) -> Tuple[np.ndarray, bytearray]:
+        """Keep the masked rows of a text column, returning its new offsets and buffer."""
+        lengths = np.diff(offsets)[keep]
+        new_offsets = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(lengths, dtype=np.int64)])
+        
+        # Rows of a document are contiguous, so copy runs of kept rows at once
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], keep.astype(np.int8), [0]])))
+        new_buffer = bytearray()
+        for start, end in zip(edges[::2], edges[1::2]):
+            new_buffer += buffer[offsets[start]:offsets[end]]
+        return new_offsets, new_buffer
+    
+    @staticmethod
+    def _concat_text(
+        offsets: np.ndarray,
+        buffer: bytearray,
+        other_offsets: np.ndarray,
+        other_buffer: bytes
+    ) -> Tuple[np.ndarray, bytearray]:
+        """Join two text columns, returning the combined offsets and buffer."""
+        if not isinstance(buffer, bytearray):
+            buffer = bytearray(buffer)  # loaded read-only
+        
+        offsets = np.concatenate([offsets, offsets[-1] + other_offsets[1:] - other_offsets[0]])
+        buffer += other_buffer[other_offsets[0]:other_offsets[-1]]
+        return offsets, buffer
+    
+    @staticmethod
+    def _extend_text(
+        offsets: np.ndarray,
+        buffer: bytearray,
+        encoded: List[bytes]
+    ) -> Tuple[np.ndarray, bytearray]:
+        """Append encoded strings to a text column, returning its new offsets and buffer."""
+        if not isinstance(buffer, bytearray):
+            buffer = bytearray(buffer)  # loaded read-only
+        
+        lengths = np.fromiter((len(text) for text in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.concatenate([offsets, offsets[-1] + np.cumsum(lengths)])
+        buffer += b"".join(encoded)
+        return offsets, buffer
+    
+    @staticmethod
+    def _preview(content: str, encoded: bytes) -> bytes:
+        """Encoded citation preview of chunk text, reusing the full encoding when short."""
+        if len(content) > CONTENT_PREVIEW_CHARS:
+            return (content[:CONTENT_PREVIEW_CHARS] + "...").encode("utf-8", "replace")
+        return encoded
+    
+    def _rebuild_previews(self) -> None:
+        """Compute previews for stores saved before they were kept."""
+        encoded = [
+            bytes(self.content_buffer[start:end])
+            for start, end in zip(self.content_offsets[:-1], self.content_offsets[1:])
+        ]
+        self.preview_offsets, self.preview_buffer = self._extend_text(
+            np.zeros(1, dtype=np.int64),
+            bytearray(),
+            [self._preview(str(content, "utf-8"), content) for content in encoded]
+        )
+    
+    def get(self, row: int) -> DocumentChunk:
+        """Rebuild the chunk stored at a row."""
+        start, end = self.content_offsets[row], self.content_offsets[row + 1]
+        page_number = int(self.page_numbers[row])
+        return DocumentChunk(
+            id=str(self.chunk_ids[row]),
+            document_id=str(self.document_ids[row]),
+            chunk_index=int(self.chunk_indexes[row]),
+            content=str(self.content_buffer[start:end], "utf-8"),
+            start_char=int(self.start_chars[row]),
+            end_char=int(self.end_chars[row]),
+            page_number=page_number if page_number >= 0 else None
+        )
+    
+    def get_preview(self, row: int) -> str:
+        """Citation preview of the chunk text stored at a row."""
+        start, end = self.preview_offsets[row], self.preview_offsets[row + 1]
+        return str(self.preview_buffer[start:end], "utf-8")
+    
+    def to_table(self, start: int = 0) -> pa.Table:
+        """Return the rows from start onwards as an Arrow table, sharing text buffers."""
+        def text_array(offsets: np.ndarray, buffer: bytearray) -> pa.LargeStringArray:
+            return pa.LargeStringArray.from_buffers(
+                len(self) - start,
+                pa.py_buffer(offsets[start:] - offsets[start]),
+                pa.py_buffer(memoryview(buffer)[offsets[start]:])
+            )
+        
+        return pa.table({
+            **{name: pa.array(getattr(self, name)[start:]) for name in self._TABLE_FIELDS},
+            "content": text_array(self.content_offsets, self.content_buffer),
+            "content_preview": text_array(self.preview_offsets, self.preview_buffer)
+        })
+    
+    @classmethod
+    def from_table(cls, table: pa.Table) -> "_ChunkColumns":
+        """Rebuild the store from a table written by to_table, without copying its buffers."""
+        columns = cls()
+        if table.num_rows == 0:
+            return columns
+        
+        def single_array(name: str) -> pa.Array:
+            column = table.column(name)
+            return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+        
+        for name in cls._TABLE_FIELDS:
+            array = single_array(name)
+            # String columns stay Arrow arrays until the first append
+            setattr(columns, name, array.to_numpy() if pa.types.is_integer(array.type) else array)
+        
+        def text_buffers(name: str) -> Tuple[np.ndarray, memoryview]:
+            array = single_array(name)
+            _, offsets, data = array.buffers()
+            offsets = np.frombuffer(offsets, dtype=np.int64)[array.offset:array.offset + len(array) + 1]
+            return offsets, memoryview(data)
+        
+        columns.content_offsets, columns.content_buffer = text_buffers("content")
+        if "content_preview" in table.column_names:
+            columns.preview_offsets, columns.preview_buffer = text_buffers("content_preview")
+        else:
+            columns._rebuild_previews()
+        return columns
+    
+    @classmethod
+    def from_arrays(cls, arrays) -> "_ChunkColumns":
+        """Rebuild the store from the npz arrays written by earlier versions."""
+        columns = cls()
+        for name in cls._ARRAY_FIELDS:
+            setattr(columns, name, arrays[name])
+        columns.content_buffer = bytearray(arrays["content_buffer"].tobytes())
+        columns._rebuild_previews()
+        return columns
+
 
 class VectorService:
     """Service for managing FAISS vector database operations."""
     
     def __init__(self):
         self.settings = get_settings()
+        # Held by every method that reads or changes the index or metadata,
+        # since one service is shared by all sessions
+        self._lock = threading.RLock()
         self.index: Optional[faiss.Index] = None
-        self.chunk_metadata: Dict[int, DocumentChunk] = {}
+        self.chunk_metadata = _ChunkColumns()  # row i describes FAISS id i
         self.document_names: Dict[str, str] = {}  # document_id -> filename
+        # Bumped whenever the indexed content changes, so callers can tell
+        # when results they derived from earlier searches are stale
+        self.version = 0
+        # Distinct document count for stats, with the version it was taken at
+        self._unique_documents: Optional[Tuple[int, int]] = None
+        # Whether the index is a read-only memory map of the saved file
+        self._index_mapped = False
         self.index_path = os.path.join(self.settings.vector_db_path, "faiss_index.bin")
-        self.metadata_path = os.path.join(self.settings.vector_db_path, "metadata.pkl")
+        self.metadata_path = os.path.join(self.settings.vector_db_path, "metadata.arrow")
+        # Pickled and npz metadata written by earlier versions, migrated on load
+        self.legacy_metadata_path = os.path.join(self.settings.vector_db_path, "metadata.pkl")
+        self.npz_metadata_path = os.path.join(self.settings.vector_db_path, "metadata.npz")
+        # Append-only shards holding vectors and metadata added since the
+        # index files were last written in full
+        self.shards_path = os.path.join(self.settings.vector_db_path, "shards")
+        
+        # Persistence state: rows already on disk, shards written since the
+        # last full write, vectors not yet saved, and whether the index files
+        # no longer describe a prefix of the index and must be rewritten
+        self._saved_rows = 0
+        self._shard_count = 0
+        self._unsaved_vectors: List[np.ndarray] = []
+        self._rewrite_needed = True
+        
+        # GPU replica of the index used for searching; the CPU index stays the
+        # copy that is added to and saved, and the replica is rebuilt lazily
+        self._gpu_resources = None
+        self._gpu_index: Optional[faiss.Index] = None
+        if self.settings.use_gpu and hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0:
+            self._gpu_resources = faiss.StandardGpuResources()
+            logger.info(f"Searching on GPU ({faiss.get_num_gpus()} available)")
+        
+        # Per-thread (1, d) buffer that single searches copy their query into
+        self._query_buffers = threading.local()
+        
+        # Micro-batching of concurrent single searches, off unless configured
+        self._batcher: Optional[_SearchBatcher] = None
+        if self.settings.search_batch_window_ms > 0:
+            self._batcher = _SearchBatcher(
+                self.search_batch,
+                self.settings.search_batch_window_ms / 1000
+            )
         
         # Ensure vector db directory exists
         os.makedirs(self.settings.vector_db_path, exist_ok=True)
@@ -30,19 +375,43 @@ class VectorService:
         # Try to load existing index
         self.load_index()
     
+    @synchronized
     def create_index(self, embedding_dimension: int) -> None:
         """Create a new FAISS index with the specified dimension."""
         logger.info(f"Creating new FAISS index with dimension {embedding_dimension}")
         
-        # Use IndexFlatIP for cosine similarity (inner product on normalized vectors)
-        self.index = faiss.IndexFlatIP(embedding_dimension)
+        # Inner product on normalized vectors gives cosine similarity; vectors
+        # are optionally stored as fp16 or int8 to cut memory and scan time
+        storage = self.settings.index_storage
+        if storage == "fp16":
+            self.index = faiss.IndexScalarQuantizer(
+                embedding_dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+            )
+        elif storage == "int8":
+            self.index = faiss.IndexScalarQuantizer(
+                embedding_dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+            # Components of unit vectors lie in [-1, 1]; training on those
+            # bounds avoids clipping vectors outside a first batch's range
+            bounds = np.eye(embedding_dimension, dtype=np.float32)
+            self.index.train(np.vstack([bounds, -bounds]))
+        else:
+            if storage != "float32":
+                logger.warning(f"Unknown index storage '{storage}', using float32")
+            self.index = faiss.IndexFlatIP(embedding_dimension)
+        self._gpu_index = None
+        self._index_mapped = False
+        self._rewrite_needed = True
+        self._unsaved_vectors = []
+        self.version += 1
         self.chunk_metadata.clear()
         self.document_names.clear()
     
+    @synchronized
     def add_embeddings(
         self,
         chunks: List[DocumentChunk],
-        embeddings: Dict[str, List[float]],
+        embeddings: Dict[str, np.ndarray],
         document_name: str
     ) -> bool:
         """
@@ -62,42 +431,60 @@ class VectorService:
                 return False
             
             # Prepare embeddings matrix
-            embedding_vectors = []
-            valid_chunks = []
+            valid_chunks = [chunk for chunk in chunks if chunk.id in embeddings]
+            if len(valid_chunks) < len(chunks):
+                for chunk in chunks:
+                    if chunk.id not in embeddings:
+                        logger.warning(f"No embedding found for chunk {chunk.id}")
             
-            for chunk in chunks:
-                if chunk.id in embeddings:
-                    embedding = embeddings[chunk.id]
-                    # Normalize for cosine similarity
-                    norm = np.linalg.norm(embedding)
-                    if norm > 0:
-                        normalized_embedding = np.array(embedding) / norm
-                        embedding_vectors.append(normalized_embedding)
-                        valid_chunks.append(chunk)
-                    else:
+            if not valid_chunks:
+                logger.error("No valid embeddings to add")
+                return False
+            
+            # Fill one preallocated float32 matrix, casting each row in place
+            dimension = len(embeddings[valid_chunks[0].id])
+            embeddings_matrix = np.empty((len(valid_chunks), dimension), dtype=np.float32)
+            for row, chunk in enumerate(valid_chunks):
+                embeddings_matrix[row] = embeddings[chunk.id]
+            
+            # Zero-norm rows cannot be normalized for cosine similarity
+            nonzero = np.einsum('ij,ij->i', embeddings_matrix, embeddings_matrix) > 0
+            if not nonzero.all():
+                for chunk, keep in zip(valid_chunks, nonzero):
+                    if not keep:
                         logger.warning(f"Zero-norm embedding for chunk {chunk.id}")
-                else:
-                    logger.warning(f"No embedding found for chunk {chunk.id}")
+                valid_chunks = [chunk for chunk, keep in zip(valid_chunks, nonzero) if keep]
+                embeddings_matrix = embeddings_matrix[nonzero]
             
-            if not embedding_vectors:
+            if not valid_chunks:
                 logger.error("No valid embeddings to add")
                 return False
             
-            # Convert to numpy array
-            embeddings_matrix = np.array(embedding_vectors, dtype=np.float32)
+            # Normalize all rows in place for cosine similarity
+            faiss.normalize_L2(embeddings_matrix)
             
             # Create index if it doesn't exist
             if self.index is None:
                 self.create_index(embeddings_matrix.shape[1])
+            elif self._index_mapped:
+                self._load_index_into_memory()
+            
+            # Move to a compressed IVF-PQ index once the corpus outgrows flat search
+            if (
+                not isinstance(self.index, faiss.IndexIVF)
+                and self.index.ntotal + len(embeddings_matrix) > self.settings.ivf_threshold
+            ):
+                self._convert_to_ivfpq(embeddings_matrix)
             
             # Add to FAISS index
-            start_idx = self.index.ntotal
             self.index.add(embeddings_matrix)
+            self._unsaved_vectors.append(embeddings_matrix)
+            self._gpu_index = None
+            self.version += 1
             
-            # Store metadata
-            for i, chunk in enumerate(valid_chunks):
-                faiss_idx = start_idx + i
-                self.chunk_metadata[faiss_idx] = chunk
+            # Store metadata; rows line up with the FAISS ids just assigned
+            self.chunk_metadata.append(valid_chunks)
+            for chunk in valid_chunks:
                 self.document_names[chunk.document_id] = document_name
             
             logger.info(f"Added {len(valid_chunks)} embeddings to vector database")
@@ -108,10 +495,79 @@ class VectorService:
             logger.error(f"Error adding embeddings to vector database: {e}")
             return False
     
-    def search(self, query_embedding: List[float], query: SearchQuery) -> SearchResponse:
+    def _convert_to_ivfpq(self, new_vectors: np.ndarray) -> None:
+        """
+        Rebuild the exhaustive index as IVF-PQ, trained on stored plus incoming vectors.
+        
+        Stored vectors are re-added in their original order, so FAISS ids and
+        chunk metadata stay aligned. The incoming vectors are left for the caller
+        to add.
+        
+        Args:
+            new_vectors: Normalized vectors about to be added
+        """
+        dimension = self.index.d
+        subquantizers = self.settings.pq_subquantizers
+        if dimension % subquantizers != 0:
+            logger.warning(
+                f"Keeping flat index: PQ{subquantizers} does not divide dimension {dimension}"
+            )
+            return
+        
+        existing = self.index.reconstruct_n(0, self.index.ntotal)
+        training = np.vstack([existing, new_vectors])
+        
+        # Keep roughly 39 training points per cell, as FAISS recommends
+        nlist = max(1, min(self.settings.ivf_nlist, len(training) // 39))
+        
+        # Training needs a point per cell and per PQ centroid, or FAISS raises
+        min_training = max(nlist, 2 ** PQ_NBITS)
+        if len(training) < min_training:
+            logger.warning(
+                f"Keeping flat index: {len(training)} vectors are too few to train IVF-PQ "
+                f"(need {min_training})"
+            )
+            return
+        
+        factory = f"IVF{nlist},PQ{subquantizers}x{PQ_NBITS}"
+        logger.info(f"Converting {self.index.ntotal} vectors to {factory} index")
+        index = faiss.index_factory(dimension, factory, faiss.METRIC_INNER_PRODUCT)
+        index.train(training)
+        index.add(existing)
+        
+        self.index = index
+        self._gpu_index = None
+        self._rewrite_needed = True
+        self._configure_index()
+    
+    def _configure_index(self) -> None:
+        """Apply search-time parameters to IVF indexes."""
+        try:
+            faiss.extract_index_ivf(self.index).nprobe = self.settings.nprobe
+        except RuntimeError:
+            pass  # not an IVF index
+    
+    def _get_search_index(self) -> faiss.Index:
+        """Return the index to search, copied to the GPU when one is in use."""
+        if self._gpu_resources is None:
+            return self.index
+        
+        if self._gpu_index is None:
+            try:
+                self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.index)
+            except Exception as e:
+                # Not every index configuration has a GPU implementation
+                logger.warning(f"Searching on CPU, index could not be moved to GPU: {e}")
+                self._gpu_index = self.index
+        return self._gpu_index
+    
+    def search(self, query_embedding: np.ndarray, query: SearchQuery) -> SearchResponse:
         """
         Perform semantic search against the vector database.
         
+        When search_batch_window_ms is set, searches arriving concurrently from
+        other sessions within that window are answered by a single FAISS call.
+        
         Args:
             query_embedding: Query embedding vector
             query: Search query parameters
@@ -119,109 +575,293 @@ class VectorService:
         Returns:
             SearchResponse with results
         """
-        start_time = time.time()
+        query_vector = self._query_buffer(query_embedding)
+        if self._batcher is not None:
+            return self._batcher.submit(query_vector, query)
+        return self.search_batch(query_vector, [query])[0]
+    
+    def _query_buffer(self, query_embedding: np.ndarray) -> np.ndarray:
+        """Copy a query embedding into this thread's reusable (1, d) float32 buffer."""
+        # The buffer is only reused by the same thread's next search, after
+        # this one has returned, and batched searches stack copies of it
+        buffer = getattr(self._query_buffers, "array", None)
+        if buffer is None or buffer.shape[1] != len(query_embedding):
+            buffer = self._query_buffers.array = np.empty((1, len(query_embedding)), dtype=np.float32)
+        np.copyto(buffer[0], query_embedding, casting="unsafe")
+        return buffer
+    
+    @synchronized
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        queries: List[SearchQuery]
+    ) -> List[SearchResponse]:
+        """
+        Search for several queries with one FAISS call.
+        
+        Args:
+            query_embeddings: (B, d) matrix of query embedding vectors
+            queries: Search parameters for each row of query_embeddings
+        
+        Returns:
+            One SearchResponse per query, in input order
+        """
+        start_time = time.perf_counter()
         
         try:
             if self.index is None or self.index.ntotal == 0:
                 logger.warning("No vectors in database for search")
-                return SearchResponse(
-                    query=query.query,
-                    results=[],
-                    total_results=0,
-                    search_time=0.0
-                )
+                return [
+                    SearchResponse(
+                        query=query.query,
+                        results=[],
+                        total_results=0,
+                        search_time=0.0
+                    )
+                    for query in queries
+                ]
             
-            # Normalize query embedding for cosine similarity
-            query_vector = np.array(query_embedding, dtype=np.float32)
-            norm = np.linalg.norm(query_vector)
-            if norm > 0:
-                query_vector = query_vector / norm
+            # Cosine similarity needs unit-length queries; embedding models that
+            # already return them are passed through without a copy
+            if self.settings.embeddings_prenormalized:
+                query_vectors = np.ascontiguousarray(np.atleast_2d(query_embeddings), dtype=np.float32)
+                if logger.isEnabledFor(logging.DEBUG):
+                    norms = np.einsum('ij,ij->i', query_vectors, query_vectors)
+                    if not np.allclose(norms, 1.0, atol=1e-3):
+                        logger.debug("Query embeddings are not unit length; disable embeddings_prenormalized")
+            else:
+                query_vectors = np.array(query_embeddings, dtype=np.float32, order="C", ndmin=2)
+                faiss.normalize_L2(query_vectors)
             
-            # Perform search
-            scores, indices = self.index.search(
-                query_vector.reshape(1, -1),
-                min(query.top_k, self.index.ntotal)
+            # Perform search, fetching enough neighbours for the largest top_k
+            k = min(max(query.top_k for query in queries), self.index.ntotal)
+            scores, indices = self._get_search_index().search(query_vectors, k)
+            
+            search_time = time.perf_counter() - start_time
+            
+            # Filter every query's hits at once: within its top_k, a real
+            # FAISS id (-1 marks empty slots) and at or above its threshold
+            top_ks = np.array([query.top_k for query in queries])[:, None]
+            thresholds = np.array([query.relevance_threshold for query in queries], dtype=np.float32)[:, None]
+            keep = (
+                (np.arange(k) < top_ks)
+                & (indices != -1)
+                & (indices < len(self.chunk_metadata))
+                & (scores >= thresholds)
             )
             
-            # Build results
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx == -1:  # FAISS returns -1 for empty slots
-                    continue
-                
-                if score >= query.relevance_threshold:
+            # Build results only for the hits that survived
+            responses = []
+            for query, query_scores, query_indices, query_keep in zip(queries, scores, indices, keep):
+                results = []
+                for score, idx in zip(query_scores[query_keep].tolist(), query_indices[query_keep].tolist()):
                     chunk = self.chunk_metadata.get(idx)
-                    if chunk:
-                        document_name = self.document_names.get(chunk.document_id, "Unknown")
-                        
-                        result = SearchResult(
-                            chunk=chunk,
-                            relevance_score=float(score),
-                            document_name=document_name
-                        )
-                        results.append(result)
-            
-            search_time = time.time() - start_time
+                    document_name = self.document_names.get(chunk.document_id, "Unknown")
+                    
+                    result = SearchResult(
+                        chunk=chunk,
+                        relevance_score=score,
+                        document_name=document_name,
+                        content_preview=self.chunk_metadata.get_preview(idx)
+                    )
+                    results.append(result)
+                
+                responses.append(SearchResponse(
+                    query=query.query,
+                    results=results,
+                    total_results=len(results),
+                    search_time=search_time
+                ))
             
-            logger.info(f"Search completed: {len(results)} results in {search_time:.3f}s")
+            logger.info("Search completed for %d queries in %.3fs", len(queries), search_time)
             
-            return SearchResponse(
-                query=query.query,
-                results=results,
-                total_results=len(results),
-                search_time=search_time
-            )
+            return responses
         
         except Exception as e:
             logger.error(f"Error performing vector search: {e}")
-            return SearchResponse(
-                query=query.query,
-                results=[],
-                total_results=0,
-                search_time=time.time() - start_time
-            )
+            return [
+                SearchResponse(
+                    query=query.query,
+                    results=[],
+                    total_results=0,
+                    search_time=time.perf_counter() - start_time
+                )
+                for query in queries
+            ]
     
+    @synchronized
     def save_index(self) -> bool:
-        """Save the FAISS index and metadata to disk."""
+        """
+        Save changes to the FAISS index and metadata since the last save.
+        
+        Added vectors are appended as a new shard, so a save writes only what
+        changed. The index and metadata files are rewritten in full after the
+        index has been rebuilt, and once max_index_shards shards have
+        accumulated, folding them back in.
+        """
         try:
             if self.index is None:
                 logger.warning("No index to save")
                 return False
             
-            # Save FAISS index
-            faiss.write_index(self.index, self.index_path)
-            
-            # Save metadata
-            metadata = {
-                "chunk_metadata": self.chunk_metadata,
-                "document_names": self.document_names
-            }
-            
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump(metadata, f)
-            
-            logger.info(f"Saved vector database to {self.index_path}")
+            if self._rewrite_needed or self._shard_count >= self.settings.max_index_shards:
+                self._write_index_files()
+            elif self._unsaved_vectors:
+                self._write_shard()
             return True
         
         except Exception as e:
             logger.error(f"Error saving vector database: {e}")
             return False
     
+    @synchronized
+    def merge_shards(self) -> bool:
+        """Rewrite the index and metadata files in full, folding in all shards."""
+        try:
+            if self.index is None:
+                logger.warning("No index to save")
+                return False
+            
+            self._write_index_files()
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error merging vector database shards: {e}")
+            return False
+    
+    def _write_index_files(self) -> None:
+        """Write the whole index and metadata, then drop the shards they now include."""
+        # Save FAISS index; write a new file and swap it in, since the
+        # current one may be memory-mapped by this or another process
+        temp_path = f"{self.index_path}.tmp"
+        faiss.write_index(self.index, temp_path)
+        os.replace(temp_path, self.index_path)
+        
+        # Save metadata as an Arrow IPC file, swapped in like the index
+        # since loaded metadata is memory-mapped too
+        self._write_table(self.chunk_metadata.to_table(), self.metadata_path)
+        
+        for shard_path in self._shard_paths():
+            for extension in (".npy", ".arrow"):
+                if os.path.exists(shard_path + extension):
+                    os.remove(shard_path + extension)
+        
+        self._saved_rows = len(self.chunk_metadata)
+        self._shard_count = 0
+        self._unsaved_vectors = []
+        self._rewrite_needed = False
+        logger.info(f"Saved vector database to {self.index_path}")
+    
+    def _write_shard(self) -> None:
+        """Append the vectors and metadata added since the last save as a new shard."""
+        os.makedirs(self.shards_path, exist_ok=True)
+        shard_path = os.path.join(self.shards_path, f"shard_{self._shard_count:05d}")
+        
+        self._write_table(
+            self.chunk_metadata.to_table(start=self._saved_rows),
+            f"{shard_path}.arrow",
+            start_row=self._saved_rows
+        )
+        
+        # The vectors file is written last and marks the shard as complete
+        temp_path = f"{shard_path}.npy.tmp"
+        with open(temp_path, 'wb') as f:
+            np.save(f, np.vstack(self._unsaved_vectors))
+        os.replace(temp_path, f"{shard_path}.npy")
+        
+        logger.info(
+            f"Saved {len(self.chunk_metadata) - self._saved_rows} vectors to shard {shard_path}"
+        )
+        self._saved_rows = len(self.chunk_metadata)
+        self._shard_count += 1
+        self._unsaved_vectors = []
+    
+    def _write_table(self, table: pa.Table, path: str, start_row: int = 0) -> None:
+        """Write metadata rows as an Arrow IPC file, replacing any existing file."""
+        table = table.replace_schema_metadata({
+            "document_names": json.dumps(self.document_names),
+            "start_row": str(start_row)
+        })
+        temp_path = f"{path}.tmp"
+        with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(temp_path, path)
+    
+    @staticmethod
+    def _read_table(path: str) -> pa.Table:
+        """Map an Arrow IPC file and read its table without copying."""
+        with pa.memory_map(path, 'r') as source:
+            return pa.ipc.open_file(source).read_all()
+    
+    def _shard_paths(self) -> List[str]:
+        """Paths, without extension, of complete shards in the order they were written."""
+        if not os.path.isdir(self.shards_path):
+            return []
+        return sorted(
+            os.path.join(self.shards_path, name[:-len(".npy")])
+            for name in os.listdir(self.shards_path)
+            if name.startswith("shard_") and name.endswith(".npy")
+        )
+    
+    @synchronized
     def load_index(self) -> bool:
         """Load the FAISS index and metadata from disk."""
         try:
-            if not os.path.exists(self.index_path) or not os.path.exists(self.metadata_path):
+            has_metadata = any(
+                os.path.exists(path)
+                for path in [self.metadata_path, self.npz_metadata_path, self.legacy_metadata_path]
+            )
+            if not os.path.exists(self.index_path) or not has_metadata:
                 logger.info("No existing vector database found")
                 return False
             
-            # Load FAISS index
-            self.index = faiss.read_index(self.index_path)
+            # Load FAISS index, mapping it rather than reading it when enabled
+            # so only the pages searches touch become resident; shards are
+            # added to it, so it is read into memory when there are any
+            shard_paths = self._shard_paths()
+            io_flags = self._mmap_io_flags() if self.settings.mmap_index and not shard_paths else 0
+            self.index = faiss.read_index(self.index_path, io_flags)
+            self._index_mapped = bool(io_flags)
+            self._gpu_index = None
+            self.version += 1
+            self._configure_index()
+            
+            # Load metadata; the Arrow file is mapped, so no per-row objects
+            # are built and only the rows that searches return are read
+            if os.path.exists(self.metadata_path):
+                table = self._read_table(self.metadata_path)
+                self.chunk_metadata = _ChunkColumns.from_table(table)
+                self.document_names = json.loads(table.schema.metadata[b"document_names"])
+            elif os.path.exists(self.npz_metadata_path):
+                with np.load(self.npz_metadata_path) as arrays:
+                    self.chunk_metadata = _ChunkColumns.from_arrays(arrays)
+                    self.document_names = dict(zip(
+                        arrays["document_name_ids"].tolist(),
+                        arrays["document_name_values"].tolist()
+                    ))
+            else:
+                self._load_legacy_metadata()
+            
+            # Replay shards saved since the files were last written in full,
+            # skipping any already folded in by an interrupted merge
+            for shard_path in shard_paths:
+                table = self._read_table(f"{shard_path}.arrow")
+                if int(table.schema.metadata[b"start_row"]) < len(self.chunk_metadata):
+                    continue
+                self.index.add(np.load(f"{shard_path}.npy"))
+                self.chunk_metadata.extend(_ChunkColumns.from_table(table))
+                self.document_names.update(json.loads(table.schema.metadata[b"document_names"]))
+            
+            self._saved_rows = len(self.chunk_metadata)
+            self._shard_count = len(shard_paths)
+            self._unsaved_vectors = []
+            # Metadata in earlier formats is rewritten as Arrow on the next save
+            self._rewrite_needed = not os.path.exists(self.metadata_path)
             
-            # Load metadata
-            with open(self.metadata_path, 'rb') as f:
-                metadata = pickle.load(f)
-                self.chunk_metadata = metadata.get("chunk_metadata", {})
-                self.document_names = metadata.get("document_names", {})
+            if len(self.chunk_metadata) != self.index.ntotal:
+                logger.warning(
+                    f"Metadata has {len(self.chunk_metadata)} rows for {self.index.ntotal} vectors"
+                )
             
             logger.info(f"Loaded vector database with {self.index.ntotal} vectors")
             return True
@@ -230,19 +870,127 @@ class VectorService:
             logger.error(f"Error loading vector database: {e}")
             return False
     
+    @staticmethod
+    def _mmap_io_flags() -> int:
+        """
+        FAISS read flags for mapping an index file read-only.
+        
+        IO_FLAG_MMAP_IFC maps the stored vectors of flat, scalar-quantized
+        and PQ indexes as well as IVF inverted lists in place; older FAISS
+        builds only offer IO_FLAG_MMAP, which maps IVF inverted lists and
+        reads everything else into memory. HNSW graphs are always read.
+        """
+        return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    
+    def _load_index_into_memory(self) -> None:
+        """Replace a memory-mapped index with an in-memory copy that can be added to."""
+        # Mapped storage cannot grow, and cloning keeps it mapped, so re-read
+        # the file, which still matches the index until it is modified
+        self.index = faiss.read_index(self.index_path)
+        self._index_mapped = False
+        self._gpu_index = None
+        self._configure_index()
+        logger.info("Loaded vector database into memory for updates")
+    
+    def _load_legacy_metadata(self) -> None:
+        """Convert pickled per-chunk metadata from earlier versions into columns."""
+        with open(self.legacy_metadata_path, 'rb') as f:
+            metadata = pickle.load(f)
+        
+        chunk_metadata = metadata.get("chunk_metadata", {})
+        self.chunk_metadata = _ChunkColumns()
+        self.chunk_metadata.append([chunk_metadata[idx] for idx in sorted(chunk_metadata)])
+        self.document_names = metadata.get("document_names", {})
+        
+        logger.info(f"Migrated {len(self.chunk_metadata)} chunk records from {self.legacy_metadata_path}")
+    
+    @synchronized
+    def remove_documents(self, document_ids: List[str]) -> int:
+        """
+        Remove the vectors of several documents in one pass over the index.
+        
+        Remaining vectors keep their relative order and are renumbered to
+        stay aligned with the chunk metadata rows. Changes are kept in memory
+        until the next save, which rewrites the index files in full.
+        
+        Args:
+            document_ids: IDs of the documents to remove
+        
+        Returns:
+            Number of vectors removed
+        """
+        try:
+            if self.index is None or not document_ids:
+                return 0
+            
+            stored_ids = self.chunk_metadata.document_ids
+            if isinstance(stored_ids, pa.Array):
+                stored_ids = stored_ids.to_numpy(zero_copy_only=False)
+            remove = np.isin(stored_ids, list(document_ids))
+            removed_ids = np.flatnonzero(remove).astype(np.int64)
+            
+            if len(removed_ids):
+                if self._index_mapped:
+                    self._load_index_into_memory()
+                
+                # One selector for all documents; flat indexes compact their
+                # storage, so later ids shift down as the metadata rows do
+                self.index.remove_ids(removed_ids)
+                if isinstance(self.index, faiss.IndexIVF):
+                    self._renumber_ivf_ids(removed_ids)
+                
+                self.chunk_metadata.keep_rows(~remove)
+                self._gpu_index = None
+                self._unsaved_vectors = []
+                self._rewrite_needed = True
+            
+            for document_id in document_ids:
+                self.document_names.pop(document_id, None)
+            self.version += 1
+            
+            logger.info(
+                f"Removed {len(removed_ids)} vectors of {len(document_ids)} documents from vector database"
+            )
+            return len(removed_ids)
+        
+        except Exception as e:
+            logger.error(f"Error removing documents from vector database: {e}")
+            return 0
+    
+    def _renumber_ivf_ids(self, removed_ids: np.ndarray) -> None:
+        """Close the gaps left by removed ids in an IVF index's inverted lists."""
+        # IVF removal leaves stored ids as they were; shift each one down by
+        # the number of removed ids below it
+        invlists = faiss.extract_index_ivf(self.index).invlists
+        for list_no in range(invlists.nlist):
+            size = invlists.list_size(list_no)
+            if size:
+                ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+                ids -= np.searchsorted(removed_ids, ids)
+    
+    @synchronized
     def clear_index(self) -> None:
         """Clear the vector database."""
         self.index = None
+        self._gpu_index = None
+        self._index_mapped = False
+        self._saved_rows = 0
+        self._shard_count = 0
+        self._unsaved_vectors = []
+        self._rewrite_needed = True
+        self.version += 1
         self.chunk_metadata.clear()
         self.document_names.clear()
         
         # Remove files
-        for path in [self.index_path, self.metadata_path]:
+        for path in [self.index_path, self.metadata_path, self.npz_metadata_path, self.legacy_metadata_path]:
             if os.path.exists(path):
                 os.remove(path)
+        shutil.rmtree(self.shards_path, ignore_errors=True)
         
         logger.info("Cleared vector database")
     
+    @synchronized
     def get_database_stats(self) -> Dict:
         """Get statistics about the vector database."""
         if self.index is None:
@@ -250,7 +998,8 @@ class VectorService:
                 "total_vectors": 0,
                 "index_size": 0,
                 "unique_documents": 0,
-                "index_type": None
+                "index_type": None,
+                "device": None
             }
         
         index_size = 0
@@ -260,6 +1009,13 @@ class VectorService:
         return {
             "total_vectors": self.index.ntotal,
             "index_size": index_size,
-            "unique_documents": len(set(self.document_names.values())),
-            "index_type": type(self.index).__name__
-        }
\ No newline at end of file
+            "unique_documents": self._count_unique_documents(),
+            "index_type": type(self.index).__name__,
+            "device": "gpu" if self._gpu_resources is not None else "cpu"
+        }
+    
+    def _count_unique_documents(self) -> int:
+        """Count distinct document names, recounting only after the index changes."""
+        if self._unique_documents is None or self._unique_documents[0] != self.version:
+            self._unique_documents = (self.version, len(set(self.document_names.values())))
+        return self._unique_documents[1]
\ No newline at end of file
@@ -1,12 +1,19 @@
+from __future__ import annotations
+
 import streamlit as st
 import logging
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 
-from ...services.chat_service import ChatService
 from ...models.conversation import ChatMessage, ChatResponse
 
+if TYPE_CHECKING:
+    from ...services.chat_service import ChatService
+
 logger = logging.getLogger(__name__)
 
+# Source citations listed before the rest are folded behind "Show more"
+CITATIONS_SHOWN = 3
+
 
 def render_chat_interface(chat_service: ChatService) -> None:
     """Render the main chat interface."""
@@ -24,13 +31,14 @@ def render_chat_interface(chat_service: ChatService) -> None:
     chat_container = st.container()
     
     with chat_container:
-        # Show conversation history
+        # Show conversation history; message text comes from the model and
+        # uploaded documents, so it is rendered as markdown without raw HTML
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
-                st.write(message["content"])
+                st.markdown(message["content"])
                 
                 # Show sources for assistant messages
-                if message["role"] == "assistant" and "sources" in message:
+                if message["role"] == "assistant" and message.get("sources"):
                     render_source_citations(message["sources"])
     
     # Chat input
@@ -45,69 +53,67 @@ def render_chat_interface(chat_service: ChatService) -> None:
         with st.chat_message("user"):
             st.write(prompt)
         
-        # Generate and display assistant response
+        # Generate and display assistant response, streaming it as it arrives
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    # Get response from chat service
-                    response = chat_service.send_message(prompt)
-                    
-                    # Display response
-                    st.write(response.content)
-                    
-                    # Display sources
-                    if response.sources:
-                        render_source_citations(response.sources)
-                    
-                    # Add assistant message to chat history
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": response.content,
-                        "sources": response.sources,
-                        "response_time": response.response_time
-                    })
+            try:
+                with st.spinner("Thinking..."):
+                    stream = chat_service.stream_message(prompt)
+                
+                st.write_stream(stream)
+                response = stream.response
+                
+                # Display sources
+                if response.sources:
+                    render_source_citations(response.sources)
+                
+                # Add assistant message to chat history
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": response.content,
+                    "sources": response.sources,
+                    "response_time": response.response_time
+                })
+            
+            except Exception as e:
+                error_message = f"I apologize, but I encountered an error: {str(e)}"
+                st.error(error_message)
                 
-                except Exception as e:
-                    error_message = f"I apologize, but I encountered an error: {str(e)}"
-                    st.error(error_message)
-                    
-                    # Add error message to chat history
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": error_message
-                    })
+                # Add error message to chat history
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": error_message
+                })
     
     # Chat controls
     render_chat_controls(chat_service)
 
 
 def render_source_citations(sources: List) -> None:
-    """Render source citations for a response."""
+    """
+    Render source citations for a response.
+    
+    The first CITATIONS_SHOWN citations are listed and the rest are folded
+    into a separate "Show more" expander, since expanders cannot be nested.
+    """
     
     if not sources:
         return
     
     with st.expander(f"📚 Sources ({len(sources)})", expanded=False):
-        for i, source in enumerate(sources, 1):
-            st.markdown(f"**Source {i}: {source.document_name}**")
-            st.markdown(f"*Relevance: {source.relevance_score:.3f}*")
-            
-            # Show page number if available
-            if source.page_number:
-                st.caption(f"Page {source.page_number}")
-            
-            # Show content preview
-            with st.container():
-                st.text_area(
-                    f"Content Preview {i}",
-                    value=source.content,
-                    height=100,
-                    disabled=True,
-                    label_visibility="collapsed"
-                )
-            
-            if i < len(sources):
-                st.divider()
+        for i, source in enumerate(sources[:CITATIONS_SHOWN], 1):
+            _render_citation(i, source)
+    
+    if len(sources) > CITATIONS_SHOWN:
+        with st.expander(f"Show {len(sources) - CITATIONS_SHOWN} more", expanded=False):
+            for i, source in enumerate(sources[CITATIONS_SHOWN:], CITATIONS_SHOWN + 1):
+                _render_citation(i, source)
+
+
+def _render_citation(i: int, source) -> None:
+    """Render one source citation; its text is shown literally, never as markup."""
+    page = f" · Page {source.page_number}" if source.page_number else ""
+    st.caption(f"Source {i}: {source.document_name} · Relevance: {source.relevance_score:.3f}{page}")
+    st.text(source.content)
 
 
 def render_chat_controls(chat_service: ChatService) -> None:
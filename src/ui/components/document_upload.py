@@ -1,14 +1,28 @@
+from __future__ import annotations
+
 import streamlit as st
 import logging
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, List, Optional
+
+from ...utils.pdf_utils import compute_file_hash
+from config.settings import get_settings
 
-from ...services.document_service import DocumentService
-from ...services.embedding_service import EmbeddingService
-from ...services.vector_service import VectorService
+if TYPE_CHECKING:
+    from ...services.document_service import DocumentService
+    from ...services.embedding_service import EmbeddingService
+    from ...services.vector_service import VectorService
 
 logger = logging.getLogger(__name__)
 
+# Files embedded concurrently during an upload
+UPLOAD_EMBED_WORKERS = 4
+
+# Documents listed per page in the knowledge base
+DOCUMENTS_PER_PAGE = 25
+
 
+@st.fragment
 def render_document_upload(
     document_service: DocumentService,
     embedding_service: EmbeddingService,
@@ -43,76 +57,146 @@ def render_document_upload(
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            for i, uploaded_file in enumerate(uploaded_files):
-                try:
-                    status_text.text(f"Processing {uploaded_file.name}...")
-                    
-                    # Read file data
-                    file_data = uploaded_file.read()
-                    
-                    # Process document
-                    result = document_service.process_uploaded_file(
-                        file_data=file_data,
-                        filename=uploaded_file.name
-                    )
+            completed = 0
+            
+            def update_progress() -> None:
+                nonlocal completed
+                completed += 1
+                progress_bar.progress(completed / len(uploaded_files))
+            
+            def save_vector_index() -> None:
+                # A failed save leaves the in-memory index intact; it can be
+                # retried from the Save Index button
+                if not vector_service.save_index():
+                    st.error("Failed to save vector database; changes are kept in memory until the next save")
+            
+            # Skip files whose exact content is already in the knowledge
+            # base, or repeated within this upload, before any parsing or
+            # embedding is done for them
+            new_files = []
+            file_hashes = []
+            for uploaded_file in uploaded_files:
+                file_hash = compute_file_hash(uploaded_file)
+                existing = document_service.find_by_hash(file_hash)
+                if existing is not None:
+                    st.info(f"⏭️ Skipped {uploaded_file.name} (identical content already indexed as {existing.filename})")
+                    update_progress()
+                elif file_hash in file_hashes:
+                    st.info(f"⏭️ Skipped {uploaded_file.name} (identical to another file in this upload)")
+                    update_progress()
+                else:
+                    new_files.append(uploaded_file)
+                    file_hashes.append(file_hash)
+            
+            # Extract and chunk all files first; multi-file uploads are
+            # parsed in parallel worker processes. UploadedFile is already a
+            # seekable file, so it is handed over without reading it here.
+            status_text.text(f"Extracting text from {len(new_files)} file(s)...")
+            results = document_service.process_uploaded_files_batch(
+                [(uploaded_file, uploaded_file.name) for uploaded_file in new_files],
+                file_hashes
+            )
+            
+            for uploaded_file, result in zip(new_files, results):
+                if not result.success:
+                    st.error(f"❌ Failed to process {uploaded_file.name}: {result.error_message}")
+                    update_progress()
+            
+            # Embed the parsed files concurrently; the embedding calls are
+            # network-bound and share the client's rate limiter. Results are
+            # added to the vector database here as they arrive; the service
+            # locks the index, so adds from other sessions are serialised too.
+            parsed = [
+                (uploaded_file, result)
+                for uploaded_file, result in zip(new_files, results)
+                if result.success
+            ]
+            if parsed:
+                status_text.text(f"Generating embeddings for {len(parsed)} file(s)...")
+                
+                # The index is saved every index_save_interval added files and
+                # once at the end, rather than after every file
+                save_interval = get_settings().index_save_interval
+                added = 0
+                
+                with ThreadPoolExecutor(max_workers=min(len(parsed), UPLOAD_EMBED_WORKERS)) as executor:
+                    futures = {
+                        executor.submit(embedding_service.generate_chunk_embeddings, result.chunks): (uploaded_file, result)
+                        for uploaded_file, result in parsed
+                    }
                     
-                    if result.success:
-                        # Generate embeddings
-                        status_text.text(f"Generating embeddings for {uploaded_file.name}...")
-                        
-                        chunk_embeddings = embedding_service.generate_chunk_embeddings(
-                            result.chunks
-                        )
-                        
-                        # Add to vector database
-                        status_text.text(f"Adding to vector database...")
-                        
-                        success = vector_service.add_embeddings(
-                            chunks=result.chunks,
-                            embeddings=chunk_embeddings,
-                            document_name=uploaded_file.name
-                        )
-                        
-                        if not success:
-                            st.error(f"Failed to add {uploaded_file.name} to vector database")
-                            continue
-                        
-                        # Save vector database
-                        vector_service.save_index()
+                    for future in as_completed(futures):
+                        uploaded_file, result = futures[future]
+                        try:
+                            chunk_embeddings = future.result()
+                            
+                            # Add to vector database
+                            status_text.text(f"Adding {uploaded_file.name} to vector database...")
+                            
+                            success = vector_service.add_embeddings(
+                                chunks=result.chunks,
+                                embeddings=chunk_embeddings,
+                                document_name=uploaded_file.name
+                            )
+                            
+                            if success:
+                                st.success(f"✅ Successfully processed {uploaded_file.name} ({result.document.total_chunks} chunks)")
+                                added += 1
+                                
+                                # Save periodically so a long upload is not lost on a crash
+                                if save_interval and added % save_interval == 0:
+                                    save_vector_index()
+                            else:
+                                st.error(f"Failed to add {uploaded_file.name} to vector database")
+                                # Unregister it so a re-upload is retried, not skipped as indexed
+                                _remove_documents(document_service, embedding_service, vector_service, [result.document.id])
                         
-                        st.success(f"✅ Successfully processed {uploaded_file.name} ({result.document.total_chunks} chunks)")
+                        except Exception as e:
+                            logger.error(f"Error processing {uploaded_file.name}: {e}")
+                            st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
+                            _remove_documents(document_service, embedding_service, vector_service, [result.document.id])
                         
-                        # Debug: Log vector database stats
-                        db_stats = vector_service.get_database_stats()
-                        logger.info(f"Vector DB stats after processing: {db_stats}")
-                    
-                    else:
-                        st.error(f"❌ Failed to process {uploaded_file.name}: {result.error_message}")
+                        # Update progress
+                        update_progress()
                 
-                except Exception as e:
-                    logger.error(f"Error processing {uploaded_file.name}: {e}")
-                    st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
+                # Save whatever was added since the last periodic save; this
+                # writes nothing if the index is unchanged
+                save_vector_index()
                 
-                # Update progress
-                progress_bar.progress((i + 1) / len(uploaded_files))
+                # Debug: Log vector database stats
+                db_stats = vector_service.get_database_stats()
+                logger.info(f"Vector DB stats after processing: {db_stats}")
             
-            status_text.text("Processing complete!")
+            status_text.text("Processing complete! The sidebar and knowledge base refresh on your next action.")
             
-            # Force update of session state to refresh sidebar
+            # The upload card is a fragment, so only it has rerun; the rest of
+            # the page picks up the new documents on the next full rerun
+            # rather than being re-rendered here
             if 'last_update' not in st.session_state:
                 st.session_state.last_update = 0
             st.session_state.last_update += 1
-            
-            st.rerun()
 
 
-def render_document_management(document_service: DocumentService) -> None:
-    """Render the document management interface."""
+@st.fragment
+def render_document_management(
+    document_service: DocumentService,
+    embedding_service: Optional[EmbeddingService],
+    vector_service: VectorService
+) -> None:
+    """
+    Render the document management interface.
+    
+    Runs as a fragment, so removing documents re-renders only this list;
+    removals happen in button callbacks, ahead of the re-render.
+    """
     
     st.header("📚 Knowledge Base")
     
-    # Get all documents
-    documents = document_service.get_all_documents()
+    if st.session_state.pop("documents_cleared", False):
+        st.success("All documents cleared!")
+    
+    # Get all documents, newest first
+    documents = document_service.get_documents_by_recency()
     
     if not documents:
         st.info("No documents uploaded yet. Use the upload section above to add documents to your knowledge base.")
@@ -131,10 +215,17 @@ def render_document_management(document_service: DocumentService) -> None:
     
     st.divider()
     
-    # Document list
+    # Document list, one page at a time so only that page's widgets are built
     st.subheader("Uploaded Documents")
     
-    for doc in sorted(documents, key=lambda x: x.upload_timestamp, reverse=True):
+    page_count = (len(documents) + DOCUMENTS_PER_PAGE - 1) // DOCUMENTS_PER_PAGE
+    page = min(st.session_state.get("documents_page", 0), page_count - 1)
+    st.session_state.documents_page = page
+    
+    if page_count > 1:
+        _render_page_controls(page, page_count, len(documents))
+    
+    for doc in documents[page * DOCUMENTS_PER_PAGE:(page + 1) * DOCUMENTS_PER_PAGE]:
         with st.container():
             col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
             
@@ -158,9 +249,14 @@ def render_document_management(document_service: DocumentService) -> None:
                 st.caption(f"{doc.file_size / 1024:.1f} KB")
             
             with col4:
-                if st.button("🗑️", key=f"delete_{doc.id}", help="Remove document"):
-                    document_service.remove_document(doc.id)
-                    st.rerun()
+                # Removed in the click's callback, before the list re-renders
+                st.button(
+                    "🗑️",
+                    key=f"delete_{doc.id}",
+                    help="Remove document",
+                    on_click=_remove_documents,
+                    args=(document_service, embedding_service, vector_service, [doc.id])
+                )
         
         # Show error message if processing failed
         if doc.processing_status == "failed" and doc.error_message:
@@ -168,16 +264,84 @@ def render_document_management(document_service: DocumentService) -> None:
         
         st.divider()
     
-    # Clear all button
-    if st.button("🗑️ Clear All Documents", type="secondary"):
-        if st.session_state.get("confirm_clear_all", False):
-            document_service.clear_all_documents()
-            st.session_state.confirm_clear_all = False
-            st.success("All documents cleared!")
-            st.rerun()
-        else:
-            st.session_state.confirm_clear_all = True
-            st.warning("Click again to confirm clearing all documents")
+    # Clear all button; its callback leaves the confirmation armed or, once
+    # cleared, a flag for the success message rendered above
+    st.button(
+        "🗑️ Clear All Documents",
+        type="secondary",
+        on_click=_clear_all_documents,
+        args=(document_service, embedding_service, vector_service)
+    )
+    if st.session_state.get("confirm_clear_all", False):
+        st.warning("Click again to confirm clearing all documents")
+
+
+def _render_page_controls(page: int, page_count: int, total_documents: int) -> None:
+    """Render Previous/Next buttons for the document list."""
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    
+    with col1:
+        st.button(
+            "◀ Previous",
+            disabled=page == 0,
+            on_click=_set_documents_page,
+            args=(page - 1,)
+        )
+    
+    with col2:
+        first = page * DOCUMENTS_PER_PAGE + 1
+        last = min((page + 1) * DOCUMENTS_PER_PAGE, total_documents)
+        st.caption(f"Page {page + 1} of {page_count} · documents {first}-{last} of {total_documents}")
+    
+    with col3:
+        st.button(
+            "Next ▶",
+            disabled=page >= page_count - 1,
+            on_click=_set_documents_page,
+            args=(page + 1,)
+        )
+
+
+def _set_documents_page(page: int) -> None:
+    """Page button callback: switch the document list to another page."""
+    st.session_state.documents_page = page
+
+
+def _remove_documents(
+    document_service: DocumentService,
+    embedding_service: Optional[EmbeddingService],
+    vector_service: VectorService,
+    document_ids: List[str]
+) -> None:
+    """Delete button callback: drop documents, their embeddings and vectors, rewriting the index once."""
+    if vector_service.remove_documents(document_ids):
+        vector_service.save_index()
+    for document_id in document_ids:
+        if embedding_service is not None:
+            for chunk in document_service.get_document_chunks(document_id):
+                embedding_service.remove_chunk_embedding(chunk.id)
+        document_service.remove_document(document_id)
+
+
+def _clear_all_documents(
+    document_service: DocumentService,
+    embedding_service: Optional[EmbeddingService],
+    vector_service: VectorService
+) -> None:
+    """Clear All button callback: arm the confirmation on the first click, clear on the second."""
+    if st.session_state.get("confirm_clear_all", False):
+        # Reset the vector store itself rather than removing listed documents:
+        # it can hold vectors of documents this process no longer knows
+        # about, such as ones loaded from disk after a restart
+        vector_service.clear_index()
+        if embedding_service is not None:
+            embedding_service.clear_all_embeddings()
+        document_service.clear_all_documents()
+        st.session_state.confirm_clear_all = False
+        st.session_state.documents_cleared = True
+    else:
+        st.session_state.confirm_clear_all = True
 
 
 def render_vector_database_info(vector_service: VectorService) -> None:
@@ -1,11 +1,17 @@
+from __future__ import annotations
+
 import streamlit as st
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-from ...services.document_service import DocumentService
-from ...services.vector_service import VectorService
-from ...services.embedding_service import EmbeddingService
 from config.settings import get_settings
 
+# The sidebar renders on every run; its service types are only needed for
+# annotations, so importing them is left to the code that builds the services
+if TYPE_CHECKING:
+    from ...services.document_service import DocumentService
+    from ...services.vector_service import VectorService
+    from ...services.embedding_service import EmbeddingService
+
 
 def render_sidebar(
     document_service: DocumentService,
@@ -1,13 +1,24 @@
+from __future__ import annotations
+
 import streamlit as st
 import logging
+from typing import TYPE_CHECKING
 
-from ...services.chat_service import ChatService
 from ..components.chat_interface import render_chat_interface, render_conversation_history
 
+if TYPE_CHECKING:
+    from ...services.chat_service import ChatService
+    from ...services.document_service import DocumentService
+    from ...services.vector_service import VectorService
+
 logger = logging.getLogger(__name__)
 
 
-def render_chat_page(chat_service: ChatService) -> None:
+def render_chat_page(
+    chat_service: ChatService,
+    document_service: DocumentService,
+    vector_service: VectorService
+) -> None:
     """Render the main chat page."""
     
     # Check if chat service is available
@@ -17,8 +28,8 @@ def render_chat_page(chat_service: ChatService) -> None:
         return
     
     # Check if there are any documents in the knowledge base
-    if hasattr(st.session_state, 'vector_service'):
-        db_stats = st.session_state.vector_service.get_database_stats()
+    if vector_service is not None:
+        db_stats = vector_service.get_database_stats()
         logger.info(f"Chat page - Vector DB stats: {db_stats}")
         
         if db_stats["total_vectors"] == 0:
@@ -27,7 +38,7 @@ def render_chat_page(chat_service: ChatService) -> None:
             # Show debug info
             with st.expander("Debug Info"):
                 st.json(db_stats)
-                doc_stats = st.session_state.document_service.get_knowledge_base_stats()
+                doc_stats = document_service.get_knowledge_base_stats()
                 st.json(doc_stats)
             
             if st.button("Go to Documents Page"):
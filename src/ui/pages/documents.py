@@ -1,15 +1,20 @@
+from __future__ import annotations
+
 import streamlit as st
 import logging
+from typing import TYPE_CHECKING
 
-from ...services.document_service import DocumentService
-from ...services.embedding_service import EmbeddingService
-from ...services.vector_service import VectorService
 from ..components.document_upload import (
     render_document_upload,
     render_document_management,
     render_vector_database_info
 )
 
+if TYPE_CHECKING:
+    from ...services.document_service import DocumentService
+    from ...services.embedding_service import EmbeddingService
+    from ...services.vector_service import VectorService
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,7 +32,7 @@ def render_documents_page(
         render_document_upload(document_service, embedding_service, vector_service)
     
     with tab2:
-        render_document_management(document_service)
+        render_document_management(document_service, embedding_service, vector_service)
     
     with tab3:
         render_vector_database_info(vector_service)
\ No newline at end of file
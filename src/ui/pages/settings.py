@@ -1,11 +1,33 @@
 import streamlit as st
 import os
 import logging
+from typing import Dict, Optional, Tuple
 
 from config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Seconds a filesystem probe is reused across reruns
+PATH_STATUS_TTL = 10
+
+
+@st.cache_data(ttl=PATH_STATUS_TTL, show_spinner=False)
+def _path_status(paths: Tuple[str, ...]) -> Dict[str, Optional[Tuple[int, float]]]:
+    """
+    Stat several paths with one os.stat each, cached briefly across reruns.
+    
+    Returns:
+        Mapping of path to (size, mtime), or None where the path does not exist
+    """
+    status = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            status[path] = (stat.st_size, stat.st_mtime)
+        except OSError:
+            status[path] = None
+    return status
+
 
 def render_settings_page() -> None:
     """Render the settings and configuration page."""
@@ -14,6 +36,15 @@ def render_settings_page() -> None:
     
     settings = get_settings()
     
+    # Environment file and storage paths, probed together
+    env_path = ".env"
+    paths_info = {
+        "Vector Database": settings.vector_db_path,
+        "File Uploads": settings.uploads_path,
+        "Logs": settings.logs_path
+    }
+    path_status = _path_status((env_path, *paths_info.values()))
+    
     # API Configuration
     st.subheader("🔑 API Configuration")
     
@@ -30,8 +61,7 @@ def render_settings_page() -> None:
             st.info("Please set OPENAI_API_KEY in your .env file")
         
         # Environment file info
-        env_path = ".env"
-        if os.path.exists(env_path):
+        if path_status[env_path] is not None:
             st.info(f"📄 Environment file found: {env_path}")
         else:
             st.warning(f"⚠️ Environment file not found. Create {env_path} from .env.example")
@@ -71,18 +101,12 @@ def render_settings_page() -> None:
     # Storage Paths
     st.subheader("💾 Storage Paths")
     
-    paths_info = {
-        "Vector Database": settings.vector_db_path,
-        "File Uploads": settings.uploads_path,
-        "Logs": settings.logs_path
-    }
-    
     for name, path in paths_info.items():
         col1, col2 = st.columns([1, 3])
         with col1:
             st.text(name)
         with col2:
-            if os.path.exists(path):
+            if path_status[path] is not None:
                 st.success(f"✅ {path}")
             else:
                 st.warning(f"⚠️ {path} (will be created)")
@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Sequence
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Keys per SELECT, below SQLite's default bound-parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store keyed by a hash of model and text.
+    
+    Vectors are kept as float32 blobs in SQLite, with an in-memory LRU of
+    recently used ones in front. Access is locked, so one cache can be
+    shared by every client in the process.
+    """
+    
+    def __init__(self, path: str, memory_size: int = 10000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.memory_size = memory_size
+        self._memory: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "hash BLOB PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vec BLOB NOT NULL)"
+        )
+    
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        """Cache key of a text embedded with a model."""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8", "surrogatepass")).digest()
+    
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up embeddings of several texts.
+        
+        Args:
+            model: Embedding model the vectors were produced with
+            texts: Texts to look up
+        
+        Returns:
+            One read-only float32 embedding per text, or None where it is not cached
+        """
+        keys = [self.key(model, text) for text in texts]
+        found = {}
+        
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            
+            # Read the rest from disk in one query per batch of keys
+            missing = list(dict.fromkeys(key for key in keys if key not in found))
+            for i in range(0, len(missing), LOOKUP_BATCH_SIZE):
+                batch = missing[i:i + LOOKUP_BATCH_SIZE]
+                rows = self._connection.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(key, found[key])
+        
+        # Arrays are shared with the in-memory LRU; the read-only flag keeps
+        # callers from changing cached vectors in place
+        return [found.get(key) for key in keys]
+    
+    def put_many(self, model: str, texts: Sequence[str], embeddings: Sequence[np.ndarray]) -> None:
+        """Store embeddings of several texts, replacing any cached for the same text."""
+        rows = []
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(model, text)
+                vector = np.asarray(embedding, dtype=np.float32)
+                if vector.flags.writeable:
+                    # Keep a private copy that callers cannot change
+                    vector = vector.copy()
+                    vector.flags.writeable = False
+                rows.append((key, model, len(vector), vector.tobytes()))
+                self._remember(key, vector)
+            
+            # One transaction for the whole batch
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings (hash, model, dim, vec) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+    
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        """Add a vector to the in-memory LRU, evicting the least recently used."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(path: str, memory_size: int) -> EmbeddingCache:
+    """Return the process-wide cache for a database path, shared by all clients."""
+    logger.info(f"Using embedding cache at {path}")
+    return EmbeddingCache(path, memory_size)
@@ -0,0 +1,19 @@
+import functools
+from typing import Callable, TypeVar
+
+F = TypeVar("F", bound=Callable)
+
+
+def synchronized(method: F) -> F:
+    """
+    Run a method while holding its instance's _lock.
+    
+    Services cached with st.cache_resource are shared by every browser
+    session, so their state is guarded by a reentrant lock that public
+    methods take for their whole call.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -1,59 +1,242 @@
+import asyncio
+import base64
+import importlib.util
+import os
+import random
+import threading
 import time
 import logging
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import Awaitable, Callable, Generator, List, Dict, Any, Optional, Tuple, TypeVar
+import httpx
+import numpy as np
 import openai
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+from .embedding_cache import EmbeddingCache, get_embedding_cache
+from config.settings import get_settings
+
+T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
+# Upper bound for a single backoff wait, in seconds
+MAX_RETRY_DELAY = 60.0
+
+# HTTP/2 multiplexes concurrent requests over one connection; it needs the
+# optional h2 package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class RateLimiter:
+    """
+    Leaky-bucket limiter that spaces requests evenly under a per-minute rate.
+    
+    Each caller reserves the next free slot under a lock and then waits for
+    it outside the lock, so threads and coroutines can share one limiter.
+    """
+    
+    def __init__(self, requests_per_minute: int):
+        self._interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+    
+    def _reserve(self) -> float:
+        """Claim the next request slot and return how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+            return slot - now
+    
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self) -> None:
+        """Wait without blocking the event loop until a request may be sent."""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(requests_per_minute: int) -> RateLimiter:
+    """Return the process-wide limiter for a rate, shared by all clients."""
+    return RateLimiter(requests_per_minute)
+
 
 class OpenAIClient:
-    """Wrapper for OpenAI API with retry logic and error handling."""
+    """Wrapper for OpenAI API with rate limiting, retry logic and error handling."""
     
     def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
-        self.max_retries = 3
+        settings = get_settings()
+        # The SDK's own retries are disabled so that the loop in
+        # _call_with_retry alone decides how often and how long to retry
+        # Both clients keep enough pooled connections alive for the
+        # concurrent requests allowed, so requests skip the TLS handshake
+        limits = httpx.Limits(
+            max_connections=settings.max_concurrent_requests,
+            max_keepalive_connections=settings.max_concurrent_requests
+        )
+        self.client = OpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=openai.DefaultHttpxClient(http2=HTTP2_AVAILABLE, limits=limits)
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(http2=HTTP2_AVAILABLE, limits=limits)
+        )
+        self.max_retries = max(1, settings.openai_retry_attempts)  # always send the request once
+        self.retry_budget = settings.openai_retry_budget
         self.base_delay = 1.0
+        self.rate_limiter = get_rate_limiter(settings.openai_requests_per_minute)
+        self.embedding_batch_size = settings.embedding_batch_size
+        self.max_concurrent_requests = settings.max_concurrent_requests
+        
+        # Embeddings of previously seen texts, served without an API call
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if settings.embedding_cache_enabled:
+            self.embedding_cache = get_embedding_cache(
+                os.path.join(settings.vector_db_path, "embedding_cache.sqlite"),
+                settings.embedding_cache_memory_size
+            )
+        
+        # Event loop that owns the async client's connections, started on
+        # first use and shared by all callers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
     
-    def get_embedding(self, text: str, model: str = "text-embedding-ada-002") -> List[float]:
+    def run_async(self, coro: Awaitable[T]) -> T:
+        """Run a coroutine on the client's event loop and wait for its result."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name="openai-client-loop",
+                    daemon=True
+                ).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
         """
-        Get embedding for a single text with retry logic.
+        Seconds to wait before retrying a failed request.
+        
+        Honours the server's Retry-After header on rate-limit responses,
+        otherwise backs off exponentially with jitter.
+        """
+        if isinstance(error, openai.RateLimitError):
+            headers = error.response.headers
+            try:
+                if "retry-after-ms" in headers:
+                    return min(float(headers["retry-after-ms"]) / 1000, MAX_RETRY_DELAY)
+                if "retry-after" in headers:
+                    return min(float(headers["retry-after"]), MAX_RETRY_DELAY)
+            except ValueError:
+                pass  # HTTP-date form, fall back to backoff
+        
+        delay = min(self.base_delay * (2 ** attempt), MAX_RETRY_DELAY)
+        return delay * random.uniform(0.5, 1.0)
+    
+    def _should_retry(self, attempt: int, error: Exception, delay: float, deadline: float) -> bool:
+        """Whether a failed attempt may be retried after waiting delay seconds."""
+        # An invalid request fails the same way however often it is sent
+        if isinstance(error, openai.BadRequestError):
+            return False
+        return attempt < self.max_retries - 1 and time.monotonic() + delay <= deadline
+    
+    def _log_failure(self, attempt: int, error: Exception, action: str) -> None:
+        """Log a failed attempt in the style of the error that caused it."""
+        if isinstance(error, openai.RateLimitError):
+            logger.warning(f"Rate limit hit while {action} (attempt {attempt + 1})")
+        elif isinstance(error, openai.APIError):
+            logger.error(f"OpenAI API error: {error}")
+        else:
+            logger.error(f"Unexpected error {action}: {error}")
+    
+    def _call_with_retry(self, request: Callable[[], T], action: str) -> T:
+        """
+        Send a rate-limited request, retrying failures with backoff.
+        
+        Retries stop after max_retries attempts, or once the next wait would
+        run past retry_budget seconds from the first attempt.
         
         Args:
-            text: Text to embed
-            model: OpenAI embedding model to use
+            request: Function performing one API request
+            action: Description of the request for log messages
         
         Returns:
-            List of floats representing the embedding vector
+            The request's result
         """
+        deadline = time.monotonic() + self.retry_budget
         for attempt in range(self.max_retries):
+            self.rate_limiter.acquire()
             try:
-                response = self.client.embeddings.create(
-                    input=text,
-                    model=model
-                )
-                return response.data[0].embedding
-            
-            except openai.RateLimitError as e:
-                wait_time = self.base_delay * (2 ** attempt)
-                logger.warning(f"Rate limit hit, waiting {wait_time}s (attempt {attempt + 1})")
-                time.sleep(wait_time)
-                if attempt == self.max_retries - 1:
-                    raise
+                return request()
             
-            except openai.APIError as e:
-                logger.error(f"OpenAI API error: {e}")
-                if attempt == self.max_retries - 1:
+            except Exception as e:
+                self._log_failure(attempt, e, action)
+                delay = self._retry_delay(attempt, e)
+                if not self._should_retry(attempt, e, delay, deadline):
                     raise
-                time.sleep(self.base_delay)
+                time.sleep(delay)
+    
+    async def _call_with_retry_async(self, request: Callable[[], Awaitable[T]], action: str) -> T:
+        """
+        Async counterpart of _call_with_retry.
+        
+        Args:
+            request: Function returning an awaitable for one API request
+            action: Description of the request for log messages
+        
+        Returns:
+            The request's result
+        """
+        deadline = time.monotonic() + self.retry_budget
+        for attempt in range(self.max_retries):
+            await self.rate_limiter.acquire_async()
+            try:
+                return await request()
             
             except Exception as e:
-                logger.error(f"Unexpected error getting embedding: {e}")
-                if attempt == self.max_retries - 1:
+                self._log_failure(attempt, e, action)
+                delay = self._retry_delay(attempt, e)
+                if not self._should_retry(attempt, e, delay, deadline):
                     raise
-                time.sleep(self.base_delay)
+                await asyncio.sleep(delay)
+    
+    def get_embedding(self, text: str, model: str = "text-embedding-ada-002") -> np.ndarray:
+        """
+        Get embedding for a single text with retry logic.
+        
+        Args:
+            text: Text to embed
+            model: OpenAI embedding model to use
+        
+        Returns:
+            float32 embedding vector
+        """
+        if self.embedding_cache:
+            cached = self.embedding_cache.get_many(model, [text])[0]
+            if cached is not None:
+                return cached
+        
+        response = self._call_with_retry(
+            lambda: self.client.embeddings.create(input=text, model=model, encoding_format="base64"),
+            "getting embedding"
+        )
+        embedding = self._decode_embedding(response.data[0].embedding)
+        
+        if self.embedding_cache:
+            self.embedding_cache.put_many(model, [text], [embedding])
+        return embedding
     
-    def get_embeddings_batch(self, texts: List[str], model: str = "text-embedding-ada-002") -> List[List[float]]:
+    def get_embeddings_batch(self, texts: List[str], model: str = "text-embedding-ada-002") -> List[Optional[np.ndarray]]:
         """
         Get embeddings for multiple texts in batch with retry logic.
         
@@ -62,47 +245,202 @@ class OpenAIClient:
             model: OpenAI embedding model to use
         
         Returns:
-            List of embedding vectors
+            List of float32 embedding vectors, None for any text the API rejects
         """
+        all_embeddings, uncached = self._lookup_embeddings(texts, model)
+        
         # OpenAI API has limits on batch size, so we process in chunks
-        batch_size = 100
-        all_embeddings = []
+        batch_size = self.embedding_batch_size
+        batches = [uncached[i:i + batch_size] for i in range(0, len(uncached), batch_size)]
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            
-            for attempt in range(self.max_retries):
-                try:
-                    response = self.client.embeddings.create(
-                        input=batch,
-                        model=model
-                    )
-                    
-                    batch_embeddings = [item.embedding for item in response.data]
-                    all_embeddings.extend(batch_embeddings)
-                    break
-                
-                except openai.RateLimitError as e:
-                    wait_time = self.base_delay * (2 ** attempt)
-                    logger.warning(f"Rate limit hit, waiting {wait_time}s (attempt {attempt + 1})")
-                    time.sleep(wait_time)
-                    if attempt == self.max_retries - 1:
-                        raise
-                
-                except openai.APIError as e:
-                    logger.error(f"OpenAI API error: {e}")
-                    if attempt == self.max_retries - 1:
-                        raise
-                    time.sleep(self.base_delay)
-                
-                except Exception as e:
-                    logger.error(f"Unexpected error getting embeddings: {e}")
-                    if attempt == self.max_retries - 1:
-                        raise
-                    time.sleep(self.base_delay)
+        self._send_batches(all_embeddings, texts, batches, model)
+        return all_embeddings
+    
+    def get_embeddings_packed(self, batches: List[List[str]], model: str = "text-embedding-ada-002") -> List[Optional[np.ndarray]]:
+        """
+        Get embeddings for texts the caller has already grouped into requests.
+        
+        Each batch is sent as one request, minus any texts already cached,
+        so the caller's packing (e.g. by token count) is kept.
+        
+        Args:
+            batches: Texts grouped into requests within the API's limits
+            model: OpenAI embedding model to use
+        
+        Returns:
+            One float32 embedding vector per text across all batches, in
+            order, None for any text the API rejects
+        """
+        texts = [text for batch in batches for text in batch]
+        all_embeddings, uncached = self._lookup_embeddings(texts, model)
+        
+        # Drop cached texts, and texts already sent in an earlier batch
+        pending = set(uncached)
+        requests = []
+        for batch in batches:
+            request = [text for text in dict.fromkeys(batch) if text in pending]
+            pending.difference_update(request)
+            if request:
+                requests.append(request)
+        
+        self._send_batches(all_embeddings, texts, requests, model)
+        return all_embeddings
+    
+    def _send_batches(
+        self,
+        all_embeddings: List[Optional[np.ndarray]],
+        texts: List[str],
+        batches: List[List[str]],
+        model: str
+    ) -> None:
+        """Embed batches of uncached texts and fill their embeddings in."""
+        # Several batches are sent concurrently on the client's event loop;
+        # a single one is sent directly
+        if len(batches) > 1:
+            fetched = self.run_async(self._request_batches_async(batches, model))
+        else:
+            fetched = [self._request_embeddings(batch, model) for batch in batches]
+        
+        for batch, embeddings in zip(batches, fetched):
+            self._fill_embeddings(all_embeddings, texts, batch, embeddings, model)
+    
+    async def get_embeddings_batch_async(
+        self,
+        texts: List[str],
+        model: str = "text-embedding-ada-002"
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Get embeddings for one batch of texts in a single request, with retry logic.
+        
+        The caller is responsible for keeping the batch within the API's
+        input and token limits. Must be awaited on the loop used by run_async.
+        
+        Args:
+            texts: List of texts to embed
+            model: OpenAI embedding model to use
         
+        Returns:
+            List of float32 embedding vectors, None for any text the API rejects
+        """
+        all_embeddings, uncached = self._lookup_embeddings(texts, model)
+        if not uncached:
+            return all_embeddings
+        
+        fetched = await self._request_embeddings_async(uncached, model)
+        self._fill_embeddings(all_embeddings, texts, uncached, fetched, model)
         return all_embeddings
     
+    def _request_embeddings(self, texts: List[str], model: str) -> List[Optional[np.ndarray]]:
+        """
+        Embed texts in one request, splitting the batch in half if the API rejects it.
+        
+        A rejected batch (e.g. one text over the token limit) is bisected
+        until the offending text is isolated; that text gets None instead of
+        failing the whole batch.
+        """
+        try:
+            response = self._call_with_retry(
+                lambda: self.client.embeddings.create(input=texts, model=model, encoding_format="base64"),
+                "getting embeddings"
+            )
+        except openai.BadRequestError:
+            if len(texts) == 1:
+                logger.error(f"Embedding request rejected for a text of {len(texts[0])} characters, skipping it")
+                return [None]
+            logger.warning(f"Embedding request for {len(texts)} texts rejected, retrying in halves")
+            middle = len(texts) // 2
+            return self._request_embeddings(texts[:middle], model) + self._request_embeddings(texts[middle:], model)
+        
+        return self._ordered_embeddings(response)
+    
+    async def _request_batches_async(
+        self,
+        batches: List[List[str]],
+        model: str
+    ) -> List[List[Optional[np.ndarray]]]:
+        """Embed several batches concurrently, each retried on its own, preserving order."""
+        # Bound in-flight requests to stay within the account's rate limits
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        
+        async def request(batch: List[str]) -> List[Optional[np.ndarray]]:
+            async with semaphore:
+                return await self._request_embeddings_async(batch, model)
+        
+        return await asyncio.gather(*(request(batch) for batch in batches))
+    
+    async def _request_embeddings_async(self, texts: List[str], model: str) -> List[Optional[np.ndarray]]:
+        """Async counterpart of _request_embeddings."""
+        try:
+            response = await self._call_with_retry_async(
+                lambda: self.async_client.embeddings.create(input=texts, model=model, encoding_format="base64"),
+                "getting embeddings"
+            )
+        except openai.BadRequestError:
+            if len(texts) == 1:
+                logger.error(f"Embedding request rejected for a text of {len(texts[0])} characters, skipping it")
+                return [None]
+            logger.warning(f"Embedding request for {len(texts)} texts rejected, retrying in halves")
+            middle = len(texts) // 2
+            return (
+                await self._request_embeddings_async(texts[:middle], model)
+                + await self._request_embeddings_async(texts[middle:], model)
+            )
+        
+        return self._ordered_embeddings(response)
+    
+    @classmethod
+    def _ordered_embeddings(cls, response) -> List[np.ndarray]:
+        """Embeddings of a response in input order, by each item's index."""
+        return [cls._decode_embedding(item.embedding) for item in sorted(response.data, key=lambda item: item.index)]
+    
+    @staticmethod
+    def _decode_embedding(embedding) -> np.ndarray:
+        """
+        Turn an embedding from the API into a float32 vector.
+        
+        Embeddings are requested base64-encoded, which the SDK leaves as is
+        when asked for explicitly, so they are read straight into an array
+        without building a Python float per dimension.
+        """
+        if isinstance(embedding, str):
+            return np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+        return np.asarray(embedding, dtype=np.float32)
+    
+    def _lookup_embeddings(self, texts: List[str], model: str) -> Tuple[List[Optional[np.ndarray]], List[str]]:
+        """
+        Look up cached embeddings for texts.
+        
+        Returns:
+            One embedding per text (None where not cached) and the distinct
+            uncached texts, in first-seen order
+        """
+        if not self.embedding_cache:
+            return [None] * len(texts), list(dict.fromkeys(texts))
+        
+        embeddings = self.embedding_cache.get_many(model, texts)
+        uncached = [text for text, embedding in zip(texts, embeddings) if embedding is None]
+        if len(uncached) < len(texts):
+            logger.info(f"Embedding cache served {len(texts) - len(uncached)} of {len(texts)} texts")
+        return embeddings, list(dict.fromkeys(uncached))
+    
+    def _fill_embeddings(
+        self,
+        all_embeddings: List[Optional[np.ndarray]],
+        texts: List[str],
+        fetched_texts: List[str],
+        fetched: List[Optional[np.ndarray]],
+        model: str
+    ) -> None:
+        """Place freshly fetched embeddings at every position of their text and cache them."""
+        by_text = dict(zip(fetched_texts, fetched))
+        for i, text in enumerate(texts):
+            if all_embeddings[i] is None and text in by_text:
+                all_embeddings[i] = by_text[text]
+        
+        if self.embedding_cache:
+            accepted = [(text, embedding) for text, embedding in zip(fetched_texts, fetched) if embedding is not None]
+            self.embedding_cache.put_many(model, [text for text, _ in accepted], [embedding for _, embedding in accepted])
+    
     def chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -122,39 +460,103 @@ class OpenAIClient:
         Returns:
             Tuple of (response_text, usage_info)
         """
-        for attempt in range(self.max_retries):
-            try:
-                response = self.client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                
-                content = response.choices[0].message.content
-                usage = {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
-                
-                return content, usage
-            
-            except openai.RateLimitError as e:
-                wait_time = self.base_delay * (2 ** attempt)
-                logger.warning(f"Rate limit hit, waiting {wait_time}s (attempt {attempt + 1})")
-                time.sleep(wait_time)
-                if attempt == self.max_retries - 1:
-                    raise
-            
-            except openai.APIError as e:
-                logger.error(f"OpenAI API error: {e}")
-                if attempt == self.max_retries - 1:
-                    raise
-                time.sleep(self.base_delay)
-            
-            except Exception as e:
-                logger.error(f"Unexpected error in chat completion: {e}")
-                if attempt == self.max_retries - 1:
-                    raise
-                time.sleep(self.base_delay)
\ No newline at end of file
+        response = self._call_with_retry(
+            lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            ),
+            "in chat completion"
+        )
+        return response.choices[0].message.content, self._usage_info(response.usage)
+    
+    async def chat_completion_async(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.7,
+        max_tokens: int = 1000
+    ) -> tuple[str, Dict[str, Any]]:
+        """
+        Get chat completion with retry logic, without blocking the event loop.
+        
+        Must be awaited on the loop used by run_async.
+        
+        Args:
+            messages: List of message dictionaries
+            model: OpenAI chat model to use
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens in response
+        
+        Returns:
+            Tuple of (response_text, usage_info)
+        """
+        response = await self._call_with_retry_async(
+            lambda: self.async_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            ),
+            "in chat completion"
+        )
+        return response.choices[0].message.content, self._usage_info(response.usage)
+    
+    def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.7,
+        max_tokens: int = 1000
+    ) -> Generator[str, None, Optional[Dict[str, Any]]]:
+        """
+        Stream a chat completion as text deltas.
+        
+        Opening the stream is retried like chat_completion; once tokens
+        have been yielded, errors propagate to the caller.
+        
+        Args:
+            messages: List of message dictionaries
+            model: OpenAI chat model to use
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens in response
+        
+        Returns:
+            Generator yielding response text; its return value is the usage info
+        """
+        stream = self._call_with_retry(
+            lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            ),
+            "in chat completion"
+        )
+        
+        usage = None
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                usage = self._usage_info(chunk.usage)
+        
+        return usage
+    
+    @staticmethod
+    def _usage_info(usage) -> Dict[str, Any]:
+        """Token usage of a completion as a plain dict."""
+        return {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens
+        }
+
+
+@lru_cache(maxsize=None)
+def get_openai_client(api_key: str) -> OpenAIClient:
+    """Return the process-wide client for an API key, shared by all services."""
+    return OpenAIClient(api_key)
\ No newline at end of file
@@ -1,70 +1,245 @@
+import hashlib
+import importlib.util
 import logging
 import io
-from typing import List, Optional
-import PyPDF2
+import mmap
+from typing import Any, BinaryIO, List, Optional, Union
 from ..models.document import Document, DocumentChunk
 
 logger = logging.getLogger(__name__)
 
+# PyMuPDF parses in C and is much faster than PyPDF2; used when installed
+PYMUPDF_AVAILABLE = importlib.util.find_spec("pymupdf") is not None
 
-def extract_text_from_pdf(pdf_file: io.BytesIO, filename: str) -> tuple[str, Optional[str]]:
+# Readers accept a PDF header anywhere in the first kilobyte of a file
+PDF_HEADER = b"%PDF-"
+PDF_HEADER_SEARCH_BYTES = 1024
+
+
+def get_file_size(pdf_file: BinaryIO) -> int:
+    """Return the size of a seekable file in bytes, leaving it at the start."""
+    pdf_file.seek(0, io.SEEK_END)
+    size = pdf_file.tell()
+    pdf_file.seek(0)
+    return size
+
+
+def compute_file_hash(pdf_file: BinaryIO) -> str:
+    """Return the SHA-256 hex digest of a seekable file, leaving it at the start."""
+    # Hash in 1 MiB pieces so large spooled uploads are not read at once
+    pdf_file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: pdf_file.read(1 << 20), b""):
+        digest.update(block)
+    pdf_file.seek(0)
+    return digest.hexdigest()
+
+
+def open_and_validate_pdf(
+    pdf_file: BinaryIO,
+    filename: str,
+    max_size: int
+) -> tuple[Optional[Any], Optional[str]]:
+    """
+    Validate a PDF file and open it for text extraction, parsing it once.
+    
+    Args:
+        pdf_file: Seekable PDF file
+        filename: Original filename, checked for a .pdf extension
+        max_size: Largest accepted file size in bytes
+    
+    Returns:
+        tuple: (document, error_message); the document, a pymupdf.Document or
+        PyPDF2.PdfReader, is None if validation fails and is meant to be passed
+        on to extract_text_from_pdf, which closes it
+    """
+    # Check file size
+    file_size = get_file_size(pdf_file)
+    if file_size > max_size:
+        return None, f"File size ({file_size} bytes) exceeds maximum allowed size ({max_size} bytes)"
+    
+    # Check file extension
+    if not filename.lower().endswith('.pdf'):
+        return None, "File must be a PDF (.pdf extension)"
+    
+    # Reject files without a PDF header before handing them to a parser
+    pdf_file.seek(0)
+    has_header = PDF_HEADER in pdf_file.read(PDF_HEADER_SEARCH_BYTES)
+    pdf_file.seek(0)
+    if not has_header:
+        return None, "Invalid PDF file: missing %PDF- header"
+    
+    # Try to read PDF structure
+    try:
+        document = _open_pdf(pdf_file)
+    except Exception as e:
+        return None, f"Invalid or corrupted PDF file: {str(e)}"
+    
+    # Check if PDF has pages
+    try:
+        total_pages = page_count(document)
+    except Exception as e:
+        close_pdf(document)
+        return None, f"Invalid or corrupted PDF file: {str(e)}"
+    
+    if total_pages == 0:
+        close_pdf(document)
+        return None, "PDF file appears to be empty (no pages found)"
+    
+    return document, None
+
+
+def extract_text_from_pdf(document: Any, filename: str) -> tuple[str, Optional[str]]:
     """
-    Extract text content from a PDF file.
+    Extract text content from a PDF opened by open_and_validate_pdf, then close it.
     
     Returns:
         tuple: (extracted_text, error_message)
     """
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text_content = ""
-        
-        for page_num, page in enumerate(pdf_reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text.strip():
-                    text_content += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-                else:
-                    logger.warning(f"No text found on page {page_num + 1} of {filename}")
-            except Exception as e:
-                logger.error(f"Error extracting text from page {page_num + 1} of {filename}: {e}")
-                continue
-        
-        if not text_content.strip():
-            return "", "No text content could be extracted from the PDF"
-        
-        return text_content.strip(), None
+        return join_page_texts(_extract_pages(document, filename, 0, page_count(document)))
         
     except Exception as e:
         error_msg = f"Failed to process PDF {filename}: {str(e)}"
         logger.error(error_msg)
         return "", error_msg
+    
+    finally:
+        close_pdf(document)
 
 
-def validate_pdf_file(file_data: bytes, filename: str, max_size: int) -> Optional[str]:
+def extract_page_range(pdf_file: BinaryIO, filename: str, start: int, stop: int) -> List[str]:
     """
-    Validate PDF file before processing.
+    Extract pages start to stop - 1 of a PDF file, for join_page_texts.
+    
+    The file is opened here, so separate processes can each extract one
+    range of a large PDF.
     
     Returns:
-        Optional[str]: Error message if validation fails, None if valid
+        Marked text of each page in the range that has any
     """
-    # Check file size
-    if len(file_data) > max_size:
-        return f"File size ({len(file_data)} bytes) exceeds maximum allowed size ({max_size} bytes)"
+    document = _open_pdf(pdf_file)
+    try:
+        return _extract_pages(document, filename, start, stop)
+    finally:
+        close_pdf(document)
+
+
+def join_page_texts(pages: List[str]) -> tuple[str, Optional[str]]:
+    """
+    Join marked page texts, in page order, into a document's text.
     
-    # Check file extension
-    if not filename.lower().endswith('.pdf'):
-        return "File must be a PDF (.pdf extension)"
+    Returns:
+        tuple: (extracted_text, error_message)
+    """
+    # Only pages with text are kept, so any page means there is content
+    if not pages:
+        return "", "No text content could be extracted from the PDF"
     
-    # Try to read PDF structure
+    # Pages are joined once at the end; growing one string page by
+    # page copies everything extracted so far on each page
+    return "".join(pages).strip(), None
+
+
+def page_count(document: Any) -> int:
+    """Number of pages of an opened PDF."""
+    if PYMUPDF_AVAILABLE:
+        return document.page_count
+    return len(document.pages)
+
+
+def close_pdf(document: Any) -> None:
+    """Release an opened PDF; PyPDF2 readers hold nothing to release."""
+    if PYMUPDF_AVAILABLE:
+        stream = document.stream
+        document.close()
+        _release(stream)
+
+
+def _open_pdf(pdf_file: BinaryIO) -> Any:
+    """Open a PDF with PyMuPDF when installed, otherwise PyPDF2."""
+    # Imported on first use; multi-file uploads only parse in worker processes
+    pdf_file.seek(0)
+    if PYMUPDF_AVAILABLE:
+        import pymupdf
+        stream = _pdf_buffer(pdf_file)
+        try:
+            return pymupdf.open(stream=stream, filetype="pdf")
+        except Exception:
+            _release(stream)
+            raise
+    
+    import PyPDF2
+    return PyPDF2.PdfReader(pdf_file)
+
+
+def _pdf_buffer(pdf_file: BinaryIO) -> Union[bytes, memoryview]:
+    """
+    Contents of a PDF file for PyMuPDF, as a view where the file is in memory.
+    
+    PyMuPDF parses a memoryview in place, so in-memory uploads and mapped
+    spooled files are not copied; other files are read into bytes.
+    """
+    if isinstance(pdf_file, io.BytesIO):
+        return pdf_file.getbuffer()
+    if isinstance(pdf_file, mmap.mmap):
+        return memoryview(pdf_file)
+    return pdf_file.read()
+
+
+def _release(stream: Any) -> None:
+    """Release a view from _pdf_buffer, so its file can be resized or closed again."""
+    # PyMuPDF keeps a reference to the view even after the document is closed
+    if isinstance(stream, memoryview):
+        stream.release()
+
+
+def _extract_pages(document: Any, filename: str, start: int, stop: int) -> List[str]:
+    """Marked text of each page from start to stop - 1 that has any, skipping pages that fail."""
+    pages: List[str] = []
+    
+    for page_num in range(start, stop):
+        try:
+            page_text = _extract_page_text(document, page_num)
+            if page_text.strip():
+                pages.append(f"\n--- Page {page_num + 1} ---\n{page_text}\n")
+            else:
+                logger.warning(f"No text found on page {page_num + 1} of {filename}")
+        except Exception as e:
+            logger.error(f"Error extracting text from page {page_num + 1} of {filename}: {e}")
+            continue
+    
+    return pages
+
+
+def _extract_page_text(document: Any, page_num: int) -> str:
+    """
+    Extract the text of one page of an opened PDF.
+    
+    Showing text takes a font, so pages that reference none, typically
+    scans, are not parsed at all and give an empty string.
+    """
+    if PYMUPDF_AVAILABLE:
+        page = document[page_num]
+        # Lists fonts of the page's form XObjects too
+        return page.get_text("text") if page.get_fonts() else ""
+    
+    page = document.pages[page_num]
+    return page.extract_text() if _pypdf2_page_may_have_text(page) else ""
+
+
+def _pypdf2_page_may_have_text(page) -> bool:
+    """Check a PyPDF2 page's resources for fonts, without decoding its content."""
     try:
-        pdf_file = io.BytesIO(file_data)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        resources = page["/Resources"].get_object()
+        if "/Font" in resources:
+            return True
         
-        # Check if PDF has pages
-        if len(pdf_reader.pages) == 0:
-            return "PDF file appears to be empty (no pages found)"
-            
-    except Exception as e:
-        return f"Invalid or corrupted PDF file: {str(e)}"
-    
-    return None
\ No newline at end of file
+        # Form XObjects carry their own resources; only image-only pages are skipped
+        xobjects = resources.get("/XObject")
+        if xobjects is None:
+            return False
+        xobjects = xobjects.get_object()
+        return any(xobjects[name].get_object().get("/Subtype") != "/Image" for name in xobjects)
+    except Exception:
+        return True  # unusual structure; let extraction decide
\ No newline at end of file
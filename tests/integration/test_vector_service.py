@@ -0,0 +1,107 @@
+import faiss
+import numpy as np
+import pytest
+
+from config.settings import get_settings
+from src.models.document import DocumentChunk
+from src.models.search import SearchQuery
+from src.services.vector_service import VectorService
+
+DIMENSION = 32
+CHUNKS_PER_DOCUMENT = 100
+
+
+@pytest.fixture
+def vector_db(tmp_path, monkeypatch):
+    """Point the settings at an empty vector database directory."""
+    monkeypatch.setenv("VECTOR_DB_PATH", str(tmp_path / "vector_db"))
+    monkeypatch.setenv("MAX_INDEX_SHARDS", "2")
+    monkeypatch.setenv("PQ_SUBQUANTIZERS", "2")
+    get_settings.cache_clear()
+    yield
+    get_settings.cache_clear()
+
+
+def make_document(document_id: str, rng: np.random.Generator):
+    chunks = [
+        DocumentChunk(
+            document_id=document_id,
+            chunk_index=i,
+            content=f"{document_id} chunk {i} é 😀",
+            start_char=i,
+            end_char=i + 1
+        )
+        for i in range(CHUNKS_PER_DOCUMENT)
+    ]
+    embeddings = {chunk.id: rng.standard_normal(DIMENSION).astype(np.float32) for chunk in chunks}
+    return chunks, embeddings
+
+
+def search_documents(service: VectorService, embedding: np.ndarray) -> set:
+    response = service.search(embedding, SearchQuery(query="q", top_k=50))
+    return {result.chunk.document_id for result in response.results}
+
+
+def assert_found(service: VectorService, chunk: DocumentChunk, embedding: np.ndarray, exact: bool) -> None:
+    """Flat search finds the chunk itself first; PQ is approximate, so only its document among the top results."""
+    if not exact:
+        assert chunk.document_id in search_documents(service, embedding)
+        return
+    
+    result = service.search(embedding, SearchQuery(query="q", top_k=1)).results[0]
+    assert result.chunk.id == chunk.id
+    assert result.chunk.content == chunk.content
+    assert result.content_preview == chunk.content
+    assert result.document_name == f"{chunk.document_id}.pdf"
+
+
+@pytest.mark.parametrize("ivf_threshold", [1000000, 250])
+def test_save_shard_load_remove_search_round_trip(vector_db, monkeypatch, ivf_threshold):
+    monkeypatch.setenv("IVF_THRESHOLD", str(ivf_threshold))
+    get_settings.cache_clear()
+    rng = np.random.default_rng(0)
+    documents = {document_id: make_document(document_id, rng) for document_id in "ABCD"}
+    exact = ivf_threshold > len(documents) * CHUNKS_PER_DOCUMENT
+    
+    # First save writes the index files, later ones append shards until
+    # max_index_shards forces a full rewrite
+    service = VectorService()
+    for document_id, (chunks, embeddings) in documents.items():
+        assert service.add_embeddings(chunks, embeddings, f"{document_id}.pdf")
+        assert service.save_index()
+    
+    service = VectorService()
+    assert isinstance(service.index, faiss.IndexIVF) == (not exact)
+    assert service.index.ntotal == len(documents) * CHUNKS_PER_DOCUMENT
+    assert len(service.chunk_metadata) == service.index.ntotal
+    
+    chunks, embeddings = documents["C"]
+    assert_found(service, chunks[7], embeddings[chunks[7].id], exact)
+    
+    assert service.remove_documents(["B"]) == CHUNKS_PER_DOCUMENT
+    assert service.remove_documents(["missing"]) == 0
+    assert service.index.ntotal == 3 * CHUNKS_PER_DOCUMENT
+    
+    removed_chunks, removed_embeddings = documents["B"]
+    assert "B" not in search_documents(service, removed_embeddings[removed_chunks[0].id])
+    
+    # Rows after the removed document were renumbered with the index
+    chunks, embeddings = documents["D"]
+    assert_found(service, chunks[42], embeddings[chunks[42].id], exact)
+    
+    assert service.save_index()
+    service = VectorService()
+    assert service.index.ntotal == 3 * CHUNKS_PER_DOCUMENT
+    assert service.get_database_stats()["unique_documents"] == 3
+    assert "B" not in search_documents(service, removed_embeddings[removed_chunks[0].id])
+    
+    chunks, embeddings = documents["A"]
+    assert_found(service, chunks[3], embeddings[chunks[3].id], exact)
+    
+    # New additions after a removal and reload are saved as shards again
+    chunks, embeddings = make_document("E", rng)
+    assert service.add_embeddings(chunks, embeddings, "E.pdf")
+    assert service.save_index()
+    service = VectorService()
+    assert service.index.ntotal == 4 * CHUNKS_PER_DOCUMENT
+    assert_found(service, chunks[0], embeddings[chunks[0].id], exact)
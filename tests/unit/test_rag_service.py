@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.services.rag_service import RAGService
+
+
+class StubEmbeddingClient:
+    """Embeds every text except those listed as rejected, as get_embeddings_batch does."""
+
+    def __init__(self, rejected):
+        self.rejected = set(rejected)
+        self.requested = []
+
+    def get_embedding(self, text, model):
+        self.requested.append(text)
+        if text in self.rejected:
+            raise ValueError(f"rejected: {text}")
+        return np.full(4, len(text), dtype=np.float32)
+
+    def get_embeddings_batch(self, texts, model):
+        self.requested.extend(texts)
+        return [
+            None if text in self.rejected else np.full(4, len(text), dtype=np.float32)
+            for text in texts
+        ]
+
+    async def get_embeddings_batch_async(self, texts, model):
+        return self.get_embeddings_batch(texts, model)
+
+
+def make_service(client: StubEmbeddingClient) -> RAGService:
+    """A RAGService with only the query-embedding cache wired up."""
+    service = RAGService.__new__(RAGService)
+    service.settings = SimpleNamespace(embedding_model="model", query_embedding_cache_size=10)
+    service.openai_client = client
+    service._query_embeddings = OrderedDict()
+    service._query_embeddings_lock = threading.Lock()
+    return service
+
+
+def test_rejected_query_raises_and_is_not_cached():
+    client = StubEmbeddingClient(rejected={"bad q"})
+    service = make_service(client)
+
+    with pytest.raises(ValueError, match="bad q"):
+        service._embed_queries(["ok q", "bad q"])
+
+    assert list(service._query_embeddings) == ["ok q"]
+    assert all(embedding is not None for embedding in service._query_embeddings.values())
+
+    # The rejected query goes back to the API; the accepted one is served from the cache
+    client.requested.clear()
+    with pytest.raises(ValueError, match="bad q"):
+        service._embed_queries(["ok q", "bad q"])
+    assert client.requested == ["bad q"]
+
+
+def test_accepted_queries_are_cached():
+    client = StubEmbeddingClient(rejected=())
+    service = make_service(client)
+
+    embeddings = service._embed_queries(["first q", "Second  Q"])
+
+    assert [embedding[0] for embedding in embeddings] == [7, 9]
+    assert list(service._query_embeddings) == ["first q", "second q"]
+
+
+def test_rejected_query_raises_and_is_not_cached_async():
+    client = StubEmbeddingClient(rejected={"bad q"})
+    service = make_service(client)
+
+    with pytest.raises(ValueError, match="bad q"):
+        asyncio.run(service._embed_queries_async(["ok q", "bad q"]))
+
+    assert list(service._query_embeddings) == ["ok q"]
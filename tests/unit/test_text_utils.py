@@ -0,0 +1,95 @@
+import pickle
+import random
+
+import pytest
+
+from src.utils.text_utils import clean_text, create_text_chunks
+
+
+def reference_chunk_spans(text: str, chunk_size: int, chunk_overlap: int):
+    """(start, end, content) of each chunk, as the original scanning loop produced them."""
+    spans = []
+    start = 0
+    
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        
+        if end < len(text):
+            sentence_break = max(
+                text.rfind('.', start, end),
+                text.rfind('!', start, end),
+                text.rfind('?', start, end)
+            )
+            if sentence_break > start + chunk_size // 2:
+                end = sentence_break + 1
+        
+        content = text[start:end].strip()
+        if content:
+            spans.append((start, end, content))
+        
+        if end >= len(text):
+            break
+        
+        start = max(start + chunk_size - chunk_overlap, end - chunk_overlap)
+        if spans and start <= spans[-1][0]:
+            start = end
+    
+    return spans
+
+
+# Words mixing ASCII, accented, non-BMP (emoji, CJK extension B) and lone
+# surrogate characters, as PDF extraction can produce all of them
+WORDS = ["the", "retrieval", "café", "naïve", "数据", "😀", "𠀀𠀁", "\ud800", "x\udfff", "...", "?!"]
+SEPARATORS = [" ", " ", " ", ". ", "! ", "? ", "\n", "\t"]
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return "".join(rng.choice(WORDS) + rng.choice(SEPARATORS) for _ in range(words))
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(50, 10), (100, 0), (120, 119), (1000, 200)])
+def test_chunk_offsets_match_reference(seed, chunk_size, chunk_overlap):
+    rng = random.Random(seed)
+    text = random_text(rng, rng.randint(1, 800))
+    
+    chunks = create_text_chunks(text, "doc", chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    
+    expected = reference_chunk_spans(clean_text(text), chunk_size, chunk_overlap)
+    assert [(chunk.start_char, chunk.end_char, chunk.content) for chunk in chunks] == expected
+    assert [chunk.chunk_index for chunk in chunks] == list(range(len(chunks)))
+
+
+def test_lone_surrogates_are_chunked():
+    text = "First sentence.\ud800 Second sentence! " * 50
+    
+    chunks = create_text_chunks(text, "doc", chunk_size=100, chunk_overlap=20)
+    
+    assert chunks
+    assert chunks[-1].end_char == len(clean_text(text))
+
+
+def test_blank_text_has_no_chunks():
+    assert create_text_chunks(" \n\t ", "doc") == []
+
+
+def test_overlap_must_be_smaller_than_chunk_size():
+    with pytest.raises(ValueError):
+        create_text_chunks("Some text.", "doc", chunk_size=100, chunk_overlap=100)
+
+
+def test_shared_metadata_is_read_only_and_picklable():
+    chunks = create_text_chunks("First sentence. Second sentence! " * 20, "doc", chunk_size=100, chunk_overlap=20)
+    
+    assert len(chunks) > 1
+    assert all(chunk.metadata is chunks[0].metadata for chunk in chunks)
+    with pytest.raises(TypeError):
+        chunks[0].metadata["source"] = "changed"
+    with pytest.raises(TypeError):
+        chunks[0].metadata.update(source="changed")
+    assert "source" not in chunks[1].metadata
+    
+    restored = pickle.loads(pickle.dumps(chunks))
+    assert restored[0].metadata == chunks[0].metadata
+    with pytest.raises(TypeError):
+        restored[0].metadata["source"] = "changed"